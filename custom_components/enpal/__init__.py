@@ -1,10 +1,19 @@
-"""IP Custom Component."""
+"""IP Custom Component.
+
+Loading the integration only imports its constants. The coordinator is
+imported when the first entry is set up and the backfill service on its
+first call.
+"""
+from __future__ import annotations
+
 import asyncio
 import logging
+from typing import TYPE_CHECKING
 
-from homeassistant import config_entries, core
+from .const import DEFAULT_PUSH_MODE, DOMAIN, SERVICE_BACKFILL_STATISTICS
 
-from .const import DOMAIN
+if TYPE_CHECKING:
+    from homeassistant import config_entries, core
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -13,14 +22,51 @@ async def async_setup_entry(
     hass: core.HomeAssistant, entry: config_entries.ConfigEntry
 ) -> bool:
     """Set up platform from a ConfigEntry."""
+    from homeassistant.exceptions import ConfigEntryNotReady
+    from homeassistant.helpers.update_coordinator import UpdateFailed
+
+    from .coordinator import EnpalDataUpdateCoordinator, create_client, get_timeout
+
     hass.data.setdefault(DOMAIN, {})
     hass_data = dict(entry.data)
+    if entry.options:
+        hass_data.update(entry.options)
+
+    # The client is kept for the lifetime of the entry so its connections are reused.
+    client = create_client(
+        hass, hass_data["enpal_host_ip"], hass_data["enpal_host_port"], hass_data["enpal_token"], get_timeout(hass_data)
+    )
+    # One coordinator per entry polls the box for all sensors at once.
+    coordinator = EnpalDataUpdateCoordinator(hass, entry.entry_id, client, hass_data)
+    try:
+        await coordinator.async_load_catalog()
+        cached = bool(coordinator.catalog)
+        if not cached:
+            # Nothing cached yet, the sensors can only be created once the fields are known.
+            await coordinator.async_discover()
+    except UpdateFailed as e:
+        await client.close()
+        raise ConfigEntryNotReady(f'{e}') from e
+    except Exception:
+        await client.close()
+        raise
+    hass_data["client"] = client
+    hass_data["coordinator"] = coordinator
+    # Sensors start out unavailable and get their values from this first poll.
+    entry.async_create_background_task(hass, coordinator.async_start(rediscover=cached), "enpal start")
+
     # Registers update listener to update config entry when options are updated.
     unsub_options_update_listener = entry.add_update_listener(options_update_listener)
     # Store a reference to the unsubscribe function to cleanup if an entry is unloaded.
     hass_data["unsub_options_update_listener"] = unsub_options_update_listener
     hass.data[DOMAIN][entry.entry_id] = hass_data
 
+    if hass_data.get("enpal_push_mode", DEFAULT_PUSH_MODE):
+        # Only entries in push mode need the write endpoint, don't load it otherwise.
+        from .push import async_register_write_view
+
+        async_register_write_view(hass)
+
     # Forward the setup to the sensor platform.
     hass.async_create_task(
         hass.config_entries.async_forward_entry_setup(entry, "sensor")
@@ -49,10 +95,39 @@ async def async_unload_entry(
 
     # Remove config entry from domain.
     if unload_ok:
-        hass.data[DOMAIN].pop(entry.entry_id)
+        hass_data = hass.data[DOMAIN].pop(entry.entry_id)
+        if hass_data.get("backfill_task") is not None:
+            hass_data["backfill_task"].cancel()
+        await hass_data["coordinator"].async_shutdown()
+        await hass_data["client"].close()
+        if not hass.data[DOMAIN]:
+            # The concurrency limits are shared by all entries, the last one takes them along.
+            from .coordinator import DATA_BACKFILL_LIMIT, DATA_POLL_LIMIT
+
+            hass.data.pop(DATA_POLL_LIMIT, None)
+            hass.data.pop(DATA_BACKFILL_LIMIT, None)
 
     return unload_ok
 
+
+async def async_remove_entry(
+    hass: core.HomeAssistant, entry: config_entries.ConfigEntry
+) -> None:
+    """Remove the persisted data of a deleted config entry."""
+    from .backfill import backfill_store
+    from .coordinator import catalog_store
+
+    await catalog_store(hass, entry.entry_id).async_remove()
+    await backfill_store(hass, entry.entry_id).async_remove()
+
+
 async def async_setup(hass: core.HomeAssistant, config: dict) -> bool:
     hass.data.setdefault(DOMAIN, {})
+
+    async def async_backfill(call: core.ServiceCall) -> None:
+        from .backfill import async_handle_backfill
+
+        await async_handle_backfill(hass, call)
+
+    hass.services.async_register(DOMAIN, SERVICE_BACKFILL_STATISTICS, async_backfill)
     return True
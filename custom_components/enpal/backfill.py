@@ -0,0 +1,173 @@
+"""Backfill of long-term statistics from the history in the Enpal box.
+
+The integration imports this module on the first call of the service.
+The recorder's statistics modules pull in SQLAlchemy, so they are only
+imported once a backfill actually runs.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any
+
+import voluptuous as vol
+from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.helpers.entity_registry import async_get
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+from .const import DOMAIN, field_config, unique_id
+from .coordinator import EnpalDataUpdateCoordinator
+from .flux import build_hourly_query, parse_value
+
+_LOGGER = logging.getLogger(__name__)
+
+BACKFILL_SCHEMA = vol.Schema(
+    {
+        vol.Optional('days', default=7): vol.All(vol.Coerce(int), vol.Range(min=1, max=365)),
+    }
+)
+BACKFILL_STORAGE_VERSION = 1
+# Each chunk is one query; the pause between them leaves the box room for regular polls.
+CHUNK = timedelta(hours=6)
+CHUNK_DELAY = 2
+# Units of counters, which are imported as state and sum instead of mean, min and max.
+COUNTER_UNITS = ('kWh', 'Wh')
+
+
+def backfill_store(hass: HomeAssistant, entry_id: str) -> Store:
+    """Store holding how far the statistics of an entry have been backfilled."""
+    return Store(hass, BACKFILL_STORAGE_VERSION, f'{DOMAIN}.{entry_id}.backfill')
+
+
+async def _async_last_sum(hass: HomeAssistant, statistic_id: str, before: datetime) -> tuple[float | None, float]:
+    """Return state and sum of the hour before ``before``, to continue counters from."""
+    from homeassistant.components.recorder import get_instance
+    from homeassistant.components.recorder.statistics import statistics_during_period
+
+    stats = await get_instance(hass).async_add_executor_job(
+        statistics_during_period, hass, before - timedelta(hours=1), before, {statistic_id}, 'hour', None, {'state', 'sum'}
+    )
+    rows = stats.get(statistic_id)
+    if not rows:
+        return None, 0.0
+    return rows[-1].get('state'), rows[-1].get('sum') or 0.0
+
+
+async def async_backfill_entry(hass: HomeAssistant, entry_id: str, days: int) -> None:
+    """Import hourly statistics of the Energy and Power sensors of an entry.
+
+    Starts where the previous run stopped, or ``days`` back on the first
+    run or when ``days`` reaches back before what earlier runs covered,
+    and stops at the last full hour. Progress and the running sums of the
+    counters are saved after every chunk, so an interrupted run resumes
+    where it left off. Counter sums continue from the statistics the
+    recorder has for the hour before the first imported one.
+    """
+    from homeassistant.components.recorder.models import StatisticData, StatisticMetaData
+    from homeassistant.components.recorder.statistics import async_import_statistics
+
+    coordinator: EnpalDataUpdateCoordinator = hass.data[DOMAIN][entry_id]['coordinator']
+    entity_registry = async_get(hass)
+
+    entities: dict[str, str] = {}
+    for measurement, field in coordinator.catalog:
+        if not field.startswith(('Energy.', 'Power.')):
+            continue
+        entity_id = entity_registry.async_get_entity_id('sensor', DOMAIN, unique_id(measurement, field))
+        if entity_id is not None:
+            entities[field] = entity_id
+    if not entities:
+        return
+
+    store = backfill_store(hass, entry_id)
+    stored = await store.async_load() or {}
+    end = dt_util.utcnow().replace(minute=0, second=0, microsecond=0)
+    requested = end - timedelta(days=days)
+    counters: dict[str, list[Any]] = stored.get('counters', {})
+    if 'watermark' in stored:
+        start = dt_util.parse_datetime(stored['watermark'])
+        # Runs before the start was stored only covered up to their watermark for sure.
+        covered = dt_util.parse_datetime(stored.get('start', stored['watermark']))
+        if requested < covered:
+            _LOGGER.info("Backfill of %s reaches back before %s, importing again from %s", entry_id, covered, requested)
+            start, covered = requested, requested
+            counters = {}
+    else:
+        start, covered = requested, requested
+
+    while start < end:
+        stop = min(start + CHUNK, end)
+        rows = await coordinator.async_query(
+            build_hourly_query(entities, start, stop), ('result', '_measurement', '_field', '_time', '_value'), backfill=True
+        )
+
+        hours: dict[str, dict[datetime, dict[str, float]]] = {}
+        for result, measurement, field, hour, value in rows:
+            if field in entities and (measurement, field) in coordinator.catalog:
+                value = parse_value(value)
+                if isinstance(value, float):
+                    hours.setdefault(field, {}).setdefault(dt_util.parse_datetime(hour), {})[result] = value
+
+        for field, rows in hours.items():
+            entity_id = entities[field]
+            unit = field_config(field).unit
+            is_counter = unit in COUNTER_UNITS
+            metadata = StatisticMetaData(
+                has_mean=not is_counter,
+                has_sum=is_counter,
+                name=None,
+                source='recorder',
+                statistic_id=entity_id,
+                unit_of_measurement=unit,
+            )
+            statistics = []
+            if is_counter:
+                if entity_id not in counters:
+                    counters[entity_id] = list(await _async_last_sum(hass, entity_id, start))
+                last_state, total = counters[entity_id]
+                for hour in sorted(rows):
+                    state = rows[hour].get('max')
+                    if state is None:
+                        continue
+                    if last_state is not None:
+                        # The day counters reset at midnight, a drop is a new count from zero
+                        total += state - last_state if state >= last_state else state
+                    last_state = state
+                    statistics.append(StatisticData(start=hour, state=state, sum=total))
+                counters[entity_id] = [last_state, total]
+            else:
+                for hour in sorted(rows):
+                    row = rows[hour]
+                    if 'mean' in row:
+                        statistics.append(StatisticData(start=hour, mean=row['mean'], min=row.get('min'), max=row.get('max')))
+            if statistics:
+                async_import_statistics(hass, metadata, statistics)
+
+        start = stop
+        await store.async_save({'start': covered.isoformat(), 'watermark': start.isoformat(), 'counters': counters})
+        if start < end:
+            await asyncio.sleep(CHUNK_DELAY)
+
+
+async def async_handle_backfill(hass: HomeAssistant, call: ServiceCall) -> None:
+    """Start a backfill of every entry that is not already backfilling."""
+    days = BACKFILL_SCHEMA(dict(call.data))['days']
+    for entry_id, entry_data in hass.data[DOMAIN].items():
+        task = entry_data.get('backfill_task')
+        if task is not None and not task.done():
+            _LOGGER.warning("Backfill of %s is still running", entry_id)
+            continue
+        entry_data['backfill_task'] = hass.async_create_background_task(
+            _async_run_backfill(hass, entry_id, days), f'{DOMAIN} backfill {entry_id}'
+        )
+
+
+async def _async_run_backfill(hass: HomeAssistant, entry_id: str, days: int) -> None:
+    try:
+        await async_backfill_entry(hass, entry_id, days)
+    except Exception as e:
+        _LOGGER.error("Backfill of statistics for %s stopped: %s", entry_id, e)
+    else:
+        _LOGGER.info("Backfill of statistics for %s finished", entry_id)
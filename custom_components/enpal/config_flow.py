@@ -1,22 +1,32 @@
 """Config flow for IP check integration."""
 from __future__ import annotations
+import asyncio
 import logging
-from typing import Any, Dict, Optional
+import time
+from http import HTTPStatus
+from typing import Any, Dict, NamedTuple, Optional
 
-import aiohttp
 import homeassistant.helpers.config_validation as cv
 import voluptuous as vol
 
 from homeassistant import config_entries
-from homeassistant.core import callback
-from influxdb_client import InfluxDBClient
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
 
-from .const import DOMAIN
+from .const import DEADBANDS, DEFAULT_ADAPTIVE_POLLING, DEFAULT_CONNECT_TIMEOUT, DEFAULT_EXTRA_FIELDS, DEFAULT_FAST_INTERVAL, DEFAULT_ONLY_ON_CHANGE, DEFAULT_PUSH_MODE, DEFAULT_READ_TIMEOUT, DEFAULT_SLOW_INTERVAL, DOMAIN, deadband_option, relative_deadband_option
+from .influx import EnpalInfluxClient, InfluxError, check_for_influx, get_timeout
 
 big_int = vol.All(vol.Coerce(int), vol.Range(min=300))
+interval = vol.All(vol.Coerce(int), vol.Range(min=5))
+timeout = vol.All(vol.Coerce(int), vol.Range(min=1, max=60))
+deadband = vol.All(vol.Coerce(float), vol.Range(min=0))
+percent = vol.All(vol.Coerce(float), vol.Range(min=0, max=100))
 
 _LOGGER = logging.getLogger(__name__)
 
+# Statuses with which the InfluxDB refuses a token, 404 being a bucket the token cannot see.
+TOKEN_REJECTED = (HTTPStatus.UNAUTHORIZED, HTTPStatus.FORBIDDEN, HTTPStatus.NOT_FOUND)
+
 CONFIG_SCHEMA = vol.Schema(
             {
                 vol.Required('enpal_host_ip', default='192.168.178.'): cv.string,
@@ -38,32 +48,63 @@ def validate_ipv4(s: str):
             return False
     return True
 
-async def get_health(ip: str, port: int):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f'http://{ip}:{port}/health') as response:
-            return await response.json()
-
-async def check_for_influx(ip: str, port: int):
-    resp = await get_health(ip, port)
-    if resp['status'] == 'pass':
-        return True
-    return False
-
-async def check_token(ip: str, port: int, token: str):
-    client = InfluxDBClient(url=f'http://{ip}:{port}', token=token, org='enpal')
-    query_api = client.query_api()
+class TokenProbe(NamedTuple):
+    valid: bool
+    latency: float
 
+async def check_token(client: EnpalInfluxClient) -> TokenProbe:
+    # Any successful answer proves the token can read the bucket, so a single
+    # point of a single field is all that is asked for.
     query = 'from(bucket: "solar") \
-      |> range(start: -2m) \
-      |> aggregateWindow(every: 2m, fn: last, createEmpty: false) \
-      |> yield(name: "last")'
-
-    tables = query_api.query(query)
-
-    if tables:
-        if len(tables) > 10:
-            return True
-    return False
+      |> range(start: -5m) \
+      |> filter(fn: (r) => r._field == "Power.DC.Total") \
+      |> limit(n: 1) \
+      |> keep(columns: ["_time"])'
+
+    start = time.monotonic()
+    try:
+        await client.query(query, ('_time',))
+    except InfluxError as e:
+        if e.status in TOKEN_REJECTED:
+            return TokenProbe(False, time.monotonic() - start)
+        raise
+    probe = TokenProbe(True, time.monotonic() - start)
+    _LOGGER.debug("Token probe of %s took %.3f s", client.url, probe.latency)
+    return probe
+
+async def validate_input(hass: HomeAssistant, data: Dict[str, Any]) -> Dict[str, str]:
+    """Check the access data, returning the errors found."""
+    errors: Dict[str, str] = {}
+    if not validate_ipv4(data['enpal_host_ip']):
+        errors['base'] = 'invalid_ip'
+    if data['enpal_host_port'] < 300:
+        errors['base'] = 'port_too_low'
+    if data['enpal_host_port'] > 65535:
+        errors['base'] = 'port_too_high'
+    if not data['enpal_token']:
+        errors['base'] = 'token_empty'
+    if errors:
+        return errors
+
+    ip, port = data['enpal_host_ip'], data['enpal_host_port']
+    # Validation only sends two requests, the shared session is good enough for that.
+    # The options flow validates with the timeouts being configured, the user flow with the defaults.
+    client = EnpalInfluxClient(async_get_clientsession(hass), ip, port, data['enpal_token'], get_timeout(data))
+    health, token_probe = await asyncio.gather(
+        check_for_influx(client),
+        check_token(client),
+        return_exceptions=True,
+    )
+    if health is not True:
+        if isinstance(health, Exception):
+            _LOGGER.debug("Health check of %s:%s failed: %s", ip, port, health)
+        errors['base'] = 'db_not_found'
+    elif isinstance(token_probe, Exception):
+        _LOGGER.debug("Token check of %s:%s failed: %s", ip, port, token_probe)
+        errors['base'] = 'token_invalid'
+    elif not token_probe.valid:
+        errors['base'] = 'token_invalid'
+    return errors
 
 
 class CustomFlow(config_entries.ConfigFlow, domain=DOMAIN):
@@ -73,21 +114,7 @@ class CustomFlow(config_entries.ConfigFlow, domain=DOMAIN):
         errors: Dict[str, str] = {}
         if user_input is not None:
             self.data = user_input
-            if not validate_ipv4(self.data['enpal_host_ip']):
-                errors['base'] = 'invalid_ip'
-            if self.data['enpal_host_port'] < 300:
-                errors['base'] = 'port_too_low'
-            if self.data['enpal_host_port'] > 65535:
-                errors['base'] = 'port_too_high'
-            if not self.data['enpal_token']:
-                errors['base'] = 'token_empty'
-
-            if not errors:
-                if not await check_for_influx(self.data['enpal_host_ip'], self.data['enpal_host_port']):
-                    errors['base'] = 'db_not_found'
-            if not errors:
-                if not check_token(self.data['enpal_host_ip'], self.data['enpal_host_port'], self.data['enpal_token']):
-                    errors['base'] = 'token_invalid'
+            errors = await validate_input(self.hass, self.data)
 
             if not errors:
                 return self.async_create_entry(title="Enpal", data=self.data)
@@ -112,24 +139,27 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
         errors: Dict[str, str] = {}
         if user_input is not None:
             self.data = user_input
-            if not validate_ipv4(self.data['enpal_host_ip']):
-                errors['base'] = 'invalid_ip'
-            if self.data['enpal_host_port'] < 300:
-                errors['base'] = 'port_too_low'
-            if self.data['enpal_host_port'] > 65535:
-                errors['base'] = 'port_too_high'
-            if not self.data['enpal_token']:
-                errors['base'] = 'token_empty'
-
-            if not errors:
-                if not await check_for_influx(self.data['enpal_host_ip'], self.data['enpal_host_port']):
-                    errors['base'] = 'db_not_found'
-            if not errors:
-                if not check_token(self.data['enpal_host_ip'], self.data['enpal_host_port'], self.data['enpal_token']):
-                    errors['base'] = 'token_invalid'
+            errors = await validate_input(self.hass, self.data)
 
             if not errors:
-                return self.async_create_entry(title="Enpal", data={'enpal_host_ip': self.data['enpal_host_ip'], 'enpal_host_port': self.data['enpal_host_port'], 'enpal_token': self.data['enpal_token']})
+                return self.async_create_entry(title="Enpal", data={
+                    'enpal_host_ip': self.data['enpal_host_ip'],
+                    'enpal_host_port': self.data['enpal_host_port'],
+                    'enpal_token': self.data['enpal_token'],
+                    'enpal_fast_interval': self.data['enpal_fast_interval'],
+                    'enpal_slow_interval': self.data['enpal_slow_interval'],
+                    'enpal_adaptive_polling': self.data['enpal_adaptive_polling'],
+                    'enpal_only_on_change': self.data['enpal_only_on_change'],
+                    'enpal_push_mode': self.data['enpal_push_mode'],
+                    'enpal_connect_timeout': self.data['enpal_connect_timeout'],
+                    'enpal_read_timeout': self.data['enpal_read_timeout'],
+                    'enpal_extra_fields': self.data.get('enpal_extra_fields', DEFAULT_EXTRA_FIELDS),
+                    **{
+                        option: self.data[option]
+                        for device_class in DEADBANDS
+                        for option in (deadband_option(device_class), relative_deadband_option(device_class))
+                    },
+                })
 
         default_ip = ''
         if 'enpal_host_ip' in self.config_entry.data:
@@ -149,11 +179,25 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
         if 'enpal_token' in self.config_entry.options:
             default_token = self.config_entry.options['enpal_token']
 
+        options = self.config_entry.options
+        deadband_schema = {}
+        for device_class, (default_deadband, default_relative_deadband) in DEADBANDS.items():
+            deadband_schema[vol.Required(deadband_option(device_class), default=options.get(deadband_option(device_class), default_deadband))] = deadband
+            deadband_schema[vol.Required(relative_deadband_option(device_class), default=options.get(relative_deadband_option(device_class), default_relative_deadband))] = percent
         OPTIONS_SCHEMA = vol.Schema(
             {
                 vol.Required('enpal_host_ip', default=default_ip): cv.string,
                 vol.Required('enpal_host_port', default=default_port): cv.positive_int,
                 vol.Required('enpal_token', default=default_token): cv.string,
+                vol.Required('enpal_fast_interval', default=options.get('enpal_fast_interval', DEFAULT_FAST_INTERVAL)): interval,
+                vol.Required('enpal_slow_interval', default=options.get('enpal_slow_interval', DEFAULT_SLOW_INTERVAL)): interval,
+                vol.Required('enpal_adaptive_polling', default=options.get('enpal_adaptive_polling', DEFAULT_ADAPTIVE_POLLING)): cv.boolean,
+                vol.Required('enpal_only_on_change', default=options.get('enpal_only_on_change', DEFAULT_ONLY_ON_CHANGE)): cv.boolean,
+                vol.Required('enpal_push_mode', default=options.get('enpal_push_mode', DEFAULT_PUSH_MODE)): cv.boolean,
+                vol.Required('enpal_connect_timeout', default=options.get('enpal_connect_timeout', DEFAULT_CONNECT_TIMEOUT)): timeout,
+                vol.Required('enpal_read_timeout', default=options.get('enpal_read_timeout', DEFAULT_READ_TIMEOUT)): timeout,
+                vol.Optional('enpal_extra_fields', default=options.get('enpal_extra_fields', DEFAULT_EXTRA_FIELDS)): cv.string,
+                **deadband_schema,
             }
         )
         return self.async_show_form(step_id="init", data_schema=OPTIONS_SCHEMA, errors=errors)
@@ -1 +1,105 @@
-DOMAIN = "enpal"
\ No newline at end of file
+"""Constants for the Enpal integration."""
+from __future__ import annotations
+
+from typing import NamedTuple
+
+DOMAIN = "enpal"
+SERVICE_BACKFILL_STATISTICS = 'backfill_statistics'
+
+# Polling intervals in seconds. Fast fields are everything but energy counters.
+DEFAULT_FAST_INTERVAL = 20
+DEFAULT_SLOW_INTERVAL = 300
+DEFAULT_ADAPTIVE_POLLING = False
+DEFAULT_ONLY_ON_CHANGE = False
+DEFAULT_PUSH_MODE = False
+# Comma-separated fields to create sensors for besides those in FIELD_MAP
+DEFAULT_EXTRA_FIELDS = ''
+# Request timeouts in seconds
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 10
+
+# Default (absolute, relative in percent) deadband per device class when only
+# changes are written, both can be changed in the options. A new value is
+# published once it differs from the last written one by more than the larger
+# of both. Classes not listed publish every change.
+DEADBANDS: dict[str, tuple[float, float]] = {
+    'power': (5.0, 1.0),
+    'voltage': (0.5, 0.0),
+    'current': (0.05, 1.0),
+}
+
+
+def deadband_option(device_class: str) -> str:
+    return f'enpal_{device_class}_deadband'
+
+
+def relative_deadband_option(device_class: str) -> str:
+    return f'enpal_{device_class}_relative_deadband'
+
+
+def unique_id(measurement: str, field: str, statistic: str | None = None) -> str:
+    """Unique ID of the sensor of a field, or of one of its rolling statistics."""
+    if statistic is not None:
+        return f'enpal_{measurement}_{field}_{statistic}'
+    return f'enpal_{measurement}_{field}'
+
+
+class EnpalSensorConfig(NamedTuple):
+    icon: str
+    name: str
+    device_class: str | None
+    unit: str | None
+    # Override the deadband of the device class for this field, relative in percent
+    deadband: float | None = None
+    relative_deadband: float | None = None
+
+FIELD_MAP: dict[str, EnpalSensorConfig] = {
+    'Power.DC.Total': EnpalSensorConfig('mdi:solar-power', 'Enpal Solar Production Power', 'power', 'W'),
+    'Power.House.Total': EnpalSensorConfig('mdi:home-lightning-bolt', 'Enpal Power House Total', 'power', 'W'),
+    'Power.External.Total': EnpalSensorConfig('mdi:home-lightning-bolt', 'Enpal Power External Total', 'power', 'W'),
+    'Energy.Consumption.Total.Day': EnpalSensorConfig('mdi:home-lightning-bolt', 'Enpal Energy Consumption', 'energy', 'kWh'),
+    
+    'Energy.External.Total.Out.Day': EnpalSensorConfig('mdi:transmission-tower-export', 'Enpal Energy External Out Day', 'energy', 'kWh'),
+    'Energy.External.Total.In.Day': EnpalSensorConfig('mdi:transmission-tower-import', 'Enpal Energy External In Day', 'energy', 'kWh'),
+    
+    'Energy.Production.Total.Day': EnpalSensorConfig('mdi:solar-power-variant', 'Enpal Production Day', 'energy', 'kWh'),
+    
+    'Voltage.Phase.A': EnpalSensorConfig('mdi:lightning-bolt', 'Enpal Voltage Phase A', 'voltage', 'V'),
+    'Current.Phase.A': EnpalSensorConfig('mdi:lightning-bolt', 'Enpal Ampere Phase A', 'current', 'A'),
+    'Power.AC.Phase.A': EnpalSensorConfig('mdi:lightning-bolt', 'Enpal Power Phase A', 'power', 'W'),
+    'Voltage.Phase.B': EnpalSensorConfig('mdi:lightning-bolt', 'Enpal Voltage Phase B', 'voltage', 'V'),
+    'Current.Phase.B': EnpalSensorConfig('mdi:lightning-bolt', 'Enpal Ampere Phase B', 'current', 'A'),
+    'Power.AC.Phase.B': EnpalSensorConfig('mdi:lightning-bolt', 'Enpal Power Phase B', 'power', 'W'),
+    'Voltage.Phase.C': EnpalSensorConfig('mdi:lightning-bolt', 'Enpal Voltage Phase C', 'voltage', 'V'),
+    'Current.Phase.C': EnpalSensorConfig('mdi:lightning-bolt', 'Enpal Ampere Phase C', 'current', 'A'),
+    'Power.AC.Phase.C': EnpalSensorConfig('mdi:lightning-bolt', 'Enpal Power Phase C', 'power', 'W'),
+    
+    'Current.String.1': EnpalSensorConfig('mdi:sun-angle', 'Enpal Current String 1', 'current', 'A'),
+    'Voltage.String.1': EnpalSensorConfig('mdi:sun-angle', 'Enpal Voltage String 1', 'voltage', 'V', deadband=2.0),
+    'Power.DC.String.1': EnpalSensorConfig('mdi:sun-angle', 'Enpal Power String 1', 'power', 'W'),
+    'Current.String.2': EnpalSensorConfig('mdi:sun-angle', 'Enpal Current String 2', 'current', 'A'),
+    'Voltage.String.2': EnpalSensorConfig('mdi:sun-angle', 'Enpal Voltage String 2', 'voltage', 'V', deadband=2.0),
+    'Power.DC.String.2': EnpalSensorConfig('mdi:sun-angle', 'Enpal Power String 2', 'power', 'W'),
+    
+    'Power.Battery.Charge.Discharge': EnpalSensorConfig('mdi:battery-charging', 'Enpal Battery Power', 'power', 'W'),
+    'Energy.Battery.Charge.Level': EnpalSensorConfig('mdi:battery', 'Enpal Battery Percent', 'battery', '%'),
+    'Energy.Battery.Charge.Day': EnpalSensorConfig('mdi:battery-arrow-up', 'Enpal Battery Charge Day', 'energy', 'kWh'),
+    'Energy.Battery.Discharge.Day': EnpalSensorConfig('mdi:battery-arrow-down', 'Enpal Battery Discharge Day', 'energy', 'kWh'),
+    'Energy.Battery.Charge.Total.Unit.1': EnpalSensorConfig('mdi:battery-arrow-up', 'Enpal Battery Charge Total', 'energy', 'kWh'),
+    'Energy.Battery.Discharge.Total.Unit.1': EnpalSensorConfig('mdi:battery-arrow-down', 'Enpal Battery Discharge Total', 'energy', 'kWh'),
+    
+    'State.Wallbox.Connector.1.Charge': EnpalSensorConfig('mdi:ev-station', 'Wallbox Charge Percent', 'battery', '%'),
+    'Power.Wallbox.Connector.1.Charging': EnpalSensorConfig('mdi:ev-station', 'Wallbox Charging Power', 'power', 'W'),
+    'Energy.Wallbox.Connector.1.Charged.Total': EnpalSensorConfig('mdi:ev-station', 'Wallbox Charging Total', 'energy', 'Wh'),
+}
+
+
+def extra_fields(config: dict) -> list[str]:
+    """Fields the user enabled besides those in FIELD_MAP."""
+    fields = (field.strip() for field in config.get('enpal_extra_fields', DEFAULT_EXTRA_FIELDS).split(','))
+    return [field for field in dict.fromkeys(fields) if field and field not in FIELD_MAP]
+
+
+def field_config(field: str) -> EnpalSensorConfig:
+    """Sensor config of a field. Extra fields get a generic one without device class and unit."""
+    return FIELD_MAP.get(field) or EnpalSensorConfig('mdi:flash', f'Enpal {field}', None, None)
@@ -0,0 +1,445 @@
+"""Data update coordinator for the Enpal integration."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import random
+import time
+from collections import deque
+from collections.abc import Iterable
+from datetime import datetime, timedelta
+from typing import Any
+
+import aiohttp
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.aiohttp_client import async_create_clientsession
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.storage import Store
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+from homeassistant.util import dt as dt_util
+
+from .const import (
+    DEFAULT_ADAPTIVE_POLLING,
+    DEFAULT_FAST_INTERVAL,
+    DEFAULT_PUSH_MODE,
+    DEFAULT_SLOW_INTERVAL,
+    DOMAIN,
+    FIELD_MAP,
+    extra_fields,
+)
+from .flux import build_last_query, parse_value
+from .history import RingBuffer
+from .influx import EnpalInfluxClient, check_for_influx, get_timeout
+
+_LOGGER = logging.getLogger(__name__)
+
+# Energy counters only change slowly, everything else is polled at the fast interval.
+SLOW_FIELDS = frozenset(field for field, config in FIELD_MAP.items() if config.device_class == 'energy')
+FAST_FIELDS = frozenset(FIELD_MAP) - SLOW_FIELDS
+# Used by adaptive polling to detect that the panels are not producing.
+PRODUCTION_FIELD = 'Power.DC.Total'
+# Fields for which recent samples are kept for rolling statistics.
+HISTORY_FIELDS = ('Power.DC.Total', 'Power.House.Total')
+HISTORY_WINDOW = timedelta(minutes=5)
+# Upper bound of samples per field, room for a push every half second.
+HISTORY_SIZE = 600
+# Window searched by a poll without watermarks, see build_last_query. After
+# a gap this long the watermarks are dropped and the full window is searched.
+LAST_WINDOW = timedelta(minutes=5)
+# Write times of the box kept to learn its write period from.
+WRITE_TIMES = 8
+# Time the box needs after a point's _time until the point can be queried.
+WRITE_MARGIN = timedelta(seconds=2)
+
+CATALOG_STORAGE_VERSION = 1
+# A field missing from this many discoveries in a row is dropped from the
+# catalog. Fields not written within the discovery window, e.g. of an idle
+# wallbox or right after the box rebooted, would otherwise lose their sensors.
+CATALOG_MAX_MISSES = 3
+
+# Shared by the coordinators of all entries, so many sites never hit the network at once.
+DATA_POLL_LIMIT = f'{DOMAIN}_poll_limit'
+MAX_CONCURRENT_POLLS = 4
+# Backfill queries scan hours of history, they have a limit of their own so they never hold up polls.
+DATA_BACKFILL_LIMIT = f'{DOMAIN}_backfill_limit'
+MAX_CONCURRENT_BACKFILLS = 1
+# Hourly aggregates over a chunk of history take the box far longer to answer than a poll.
+BACKFILL_TIMEOUT = timedelta(minutes=2)
+# Failed polls are retried at doubling intervals up to this one.
+MAX_BACKOFF_INTERVAL = timedelta(minutes=10)
+# The failure count keeps growing during long outages, only this many doublings are applied.
+MAX_BACKOFF_DOUBLINGS = 10
+# After this many failed polls in a row only /health is probed until it passes again.
+CIRCUIT_BREAKER_THRESHOLD = 3
+
+
+def catalog_store(hass: HomeAssistant, entry_id: str) -> Store:
+    """Store holding the discovered fields of an entry."""
+    return Store(hass, CATALOG_STORAGE_VERSION, f'{DOMAIN}.{entry_id}.catalog')
+
+
+def signal_catalog_updated(entry_id: str) -> str:
+    """Dispatcher signal sent when the discovered fields of an entry changed."""
+    return f'{DOMAIN}_{entry_id}_catalog_updated'
+
+
+def build_catalog(keys: Iterable[tuple[str, str]], fields: Iterable[str] = FIELD_MAP) -> list[tuple[str, str]]:
+    """Pick the ``(measurement, field)`` pairs of ``fields`` sensors are created for."""
+    catalog = []
+    encountered_fields = set()
+    for measurement, field in keys:
+        if field in encountered_fields:
+            # There may be duplicates because of different _measurement values
+            # e.g. "inverter" and "powerSensor" share some fields
+            # we also can't choose which measurement's field to use, 
+            # since different Enpal devices have different measurements for the same fields
+            # Why? idk, ask Enpal
+            continue
+        encountered_fields.add(field)
+        if field not in fields:
+            _LOGGER.debug("Encountered field %s without config. This is normal. Skipping", field)
+            continue
+        catalog.append((measurement, field))
+    return catalog
+
+
+def create_client(hass: HomeAssistant, ip: str, port: int, token: str, timeout: aiohttp.ClientTimeout) -> EnpalInfluxClient:
+    """Create the long-lived client an entry uses for all of its queries.
+
+    The client gets a session of its own, so its connections to the box
+    are kept alive between polls and closed together with the entry. The
+    CSV responses compress well, so they are requested gzipped; the client
+    inflates them itself to count what actually crossed the network.
+    """
+    session = async_create_clientsession(hass, auto_decompress=False)
+    return EnpalInfluxClient(session, ip, port, token, timeout, decompress=True)
+
+
+class PollStatistics:
+    """Counters of the queries a coordinator sent to the box, for diagnostics."""
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.failures = 0
+        self.bytes_received = 0
+        self.bytes_on_wire = 0
+        self.last_duration: float | None = None
+        self.last_bytes: int | None = None
+        self.last_wire_bytes: int | None = None
+
+    def record(self, duration: float, received: int | None, on_wire: int | None = None) -> None:
+        self.queries += 1
+        self.last_duration = duration
+        if received is None:
+            self.failures += 1
+        else:
+            self.bytes_received += received
+            self.last_bytes = received
+        if on_wire is not None:
+            self.bytes_on_wire += on_wire
+            self.last_wire_bytes = on_wire
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            'queries': self.queries,
+            'failures': self.failures,
+            'bytes_received': self.bytes_received,
+            'bytes_on_wire': self.bytes_on_wire,
+            'last_duration': self.last_duration,
+            'last_bytes': self.last_bytes,
+            'last_wire_bytes': self.last_wire_bytes,
+        }
+
+
+class EnpalDataUpdateCoordinator(DataUpdateCoordinator[dict[tuple[str, str], float | str]]):
+    """Polls all fields of one Enpal box with a single query.
+
+    The result is a mapping of ``(measurement, field)`` to the latest value,
+    which every sensor of the config entry reads from. Energy counters are
+    only included in the query once per slow interval; in between their
+    previous values are carried over. With adaptive polling the fast
+    interval is relaxed to the slow one while there is no solar production.
+
+    In push mode values arrive through ``async_push`` and polling at the
+    slow interval only serves as a fallback. Every push postpones the next
+    poll, so a steady stream of writes causes no queries at all.
+
+    The discovered ``catalog`` of fields is persisted, so sensors can be
+    created on restart without asking the box first.
+
+    Polls of all entries share one concurrency limit, backfill queries
+    another. The first poll is delayed by a random jitter so several
+    gateways do not poll in lockstep, and failed polls back off exponentially per gateway. After
+    repeated failures the circuit opens: polls are replaced by a cheap
+    ``/health`` probe until the box answers again.
+
+    Polls only search the gateway's storage from the oldest ``_time`` seen
+    for the polled series on, so a poll where nothing was written scans
+    and returns next to nothing; series missing from such a response keep
+    their value. After a gap in polling, or once a series has fallen
+    ``LAST_WINDOW`` behind the others, the full window is searched again,
+    which also drops series that have gone quiet.
+
+    The box writes on a schedule of its own. From the ``_time`` of the
+    latest points the coordinator learns the write period and phase, and
+    places each fast poll just after an expected write, never earlier than
+    the fast interval.
+
+    For ``HISTORY_FIELDS`` the samples written in the last
+    ``HISTORY_WINDOW`` are kept in ring buffers for rolling statistics,
+    timed by the ``_time`` of their points.
+    """
+
+    def __init__(self, hass: HomeAssistant, entry_id: str, client: EnpalInfluxClient, config: dict[str, Any]):
+        self.fast_interval = timedelta(seconds=config.get('enpal_fast_interval', DEFAULT_FAST_INTERVAL))
+        self.slow_interval = timedelta(seconds=config.get('enpal_slow_interval', DEFAULT_SLOW_INTERVAL))
+        self.adaptive_polling = config.get('enpal_adaptive_polling', DEFAULT_ADAPTIVE_POLLING)
+        self.push_mode = config.get('enpal_push_mode', DEFAULT_PUSH_MODE)
+        # Extra fields have no device class, they are polled with the fast ones.
+        self.extra_fields = extra_fields(config)
+        self.fields = frozenset(FIELD_MAP).union(self.extra_fields)
+        self.fast_fields = FAST_FIELDS.union(self.extra_fields)
+        super().__init__(hass, _LOGGER, name=DOMAIN, update_interval=self.fast_interval)
+        self.entry_id = entry_id
+        self.client = client
+        self.ip = config['enpal_host_ip']
+        self.port = config['enpal_host_port']
+        self.timeout = get_timeout(config)
+        self.statistics = PollStatistics()
+        self.catalog: list[tuple[str, str]] = []
+        self._catalog_store = catalog_store(hass, entry_id)
+        # Discoveries in a row each catalog field was missing from
+        self._catalog_misses: dict[str, int] = {}
+        self._slow_fields_due = 0.0
+        self._poll_limit: asyncio.Semaphore = hass.data.setdefault(DATA_POLL_LIMIT, asyncio.Semaphore(MAX_CONCURRENT_POLLS))
+        self._backfill_limit: asyncio.Semaphore = hass.data.setdefault(DATA_BACKFILL_LIMIT, asyncio.Semaphore(MAX_CONCURRENT_BACKFILLS))
+        self._failures = 0
+        self._watermarks: dict[tuple[str, str], datetime] = {}
+        self._last_success: float | None = None
+        self._write_times: deque[datetime] = deque(maxlen=WRITE_TIMES)
+        self.history = {field: RingBuffer(HISTORY_WINDOW.total_seconds(), HISTORY_SIZE) for field in HISTORY_FIELDS}
+
+    async def async_load_catalog(self) -> None:
+        stored = await self._catalog_store.async_load()
+        if stored:
+            # Fields may have lost their sensor config since the catalog was saved.
+            self.catalog = [(measurement, field) for measurement, field in stored['catalog'] if field in self.fields]
+            self._catalog_misses = stored.get('misses', {})
+
+    async def async_discover(self) -> None:
+        """Query which fields the box has and persist the catalog if it changed.
+
+        Fields that are found are added right away, fields that are missing
+        are only dropped after ``CATALOG_MAX_MISSES`` discoveries in a row.
+        """
+        try:
+            found = build_catalog(await self.async_query(build_last_query(sorted(self.fields)), ('_measurement', '_field')), self.fields)
+        except Exception as e:
+            raise UpdateFailed(f'{e}') from e
+        found_fields = {field for _, field in found}
+        catalog = []
+        misses = {}
+        for measurement, field in self.catalog:
+            if field in found_fields:
+                continue
+            missed = self._catalog_misses.get(field, 0) + 1
+            if missed < CATALOG_MAX_MISSES:
+                catalog.append((measurement, field))
+                misses[field] = missed
+            else:
+                _LOGGER.info("Field %s was missing from %d discoveries in a row, removing its sensors", field, missed)
+        catalog.extend(found)
+        if set(catalog) == set(self.catalog) and misses == self._catalog_misses:
+            return
+        changed = set(catalog) != set(self.catalog)
+        self.catalog = catalog
+        self._catalog_misses = misses
+        await self._catalog_store.async_save({'catalog': [list(key) for key in catalog], 'misses': misses})
+        if changed:
+            async_dispatcher_send(self.hass, signal_catalog_updated(self.entry_id))
+
+    async def async_start(self, rediscover: bool) -> None:
+        """Run the first poll after a random jitter and, for a cached catalog, a rediscovery after it."""
+        await asyncio.sleep(random.uniform(0, self.fast_interval.total_seconds()))
+        await self.async_refresh()
+        if rediscover:
+            await self.async_rediscover()
+
+    async def async_rediscover(self) -> None:
+        """Check a cached catalog in the background, keeping it if the box is unreachable."""
+        try:
+            await self.async_discover()
+        except UpdateFailed as e:
+            _LOGGER.warning("Could not rediscover the fields of the Enpal box: %s", e)
+
+    async def _async_update_data(self) -> dict[tuple[str, str], float | str]:
+        now = time.monotonic()
+        fields = self.fast_fields
+        if now >= self._slow_fields_due:
+            fields = self.fields
+
+        try:
+            if self.circuit_open and not await self._async_probe_health():
+                raise UpdateFailed(f'{self.ip}:{self.port} is still unreachable')
+            start = self._query_start(fields, now)
+            rows = await self.async_query(build_last_query(fields, start), ('_measurement', '_field', '_value', '_time'))
+            fetched = {}
+            samples = []
+            latest = None
+            for measurement, field, value, point_time in rows:
+                key = (measurement, field)
+                fetched[key] = parse_value(value)
+                written = dt_util.parse_datetime(point_time)
+                if written is not None:
+                    self._watermarks[key] = written
+                    samples.append((key, fetched[key], written.timestamp()))
+                    if latest is None or written > latest:
+                        latest = written
+        except Exception as e:
+            self._failures += 1
+            backoff = self.fast_interval.total_seconds() * 2 ** min(self._failures, MAX_BACKOFF_DOUBLINGS)
+            self.update_interval = timedelta(seconds=min(backoff, MAX_BACKOFF_INTERVAL.total_seconds()))
+            if self._failures == CIRCUIT_BREAKER_THRESHOLD:
+                _LOGGER.warning("Enpal box at %s:%s failed %d polls in a row, waiting for it to become healthy", self.ip, self.port, self._failures)
+            if isinstance(e, UpdateFailed):
+                raise
+            raise UpdateFailed(f'{e}') from e
+        if self.circuit_open:
+            _LOGGER.info("Enpal box at %s:%s is reachable again", self.ip, self.port)
+        self._failures = 0
+        self._last_success = now
+        if latest is not None and (not self._write_times or latest > self._write_times[-1]):
+            self._write_times.append(latest)
+
+        if fields is not self.fast_fields:
+            self._slow_fields_due = now + self.slow_interval.total_seconds()
+        if start is None:
+            # Keep what was not queried this time, but drop series that have gone quiet.
+            values = {key: value for key, value in (self.data or {}).items() if key[1] not in fields}
+            for key in [key for key in self._watermarks if key[1] in fields and key not in fetched]:
+                del self._watermarks[key]
+        else:
+            # Series without points since the watermark just have not changed.
+            values = dict(self.data or {})
+        values.update(fetched)
+        self._record_history(samples)
+
+        self.update_interval = self._next_interval(values)
+        return values
+
+    def _query_start(self, fields: frozenset[str], now: float) -> datetime | None:
+        """Return from when ``fields`` need to be searched, or None for the full window."""
+        if self._last_success is None or now - self._last_success > LAST_WINDOW.total_seconds():
+            return None
+        marks = [written for key, written in self._watermarks.items() if key[1] in fields]
+        if not marks:
+            return None
+        oldest = min(marks)
+        # Slow fields are only polled once per slow interval, so their watermarks lag behind by that much.
+        if max(self._watermarks.values()) - oldest > LAST_WINDOW + self.slow_interval:
+            return None
+        # The watermark point itself was already seen, only later ones are of interest.
+        return oldest + timedelta(microseconds=1)
+
+    @property
+    def circuit_open(self) -> bool:
+        return self._failures >= CIRCUIT_BREAKER_THRESHOLD
+
+    async def _async_probe_health(self) -> bool:
+        try:
+            return await check_for_influx(self.client)
+        except Exception as e:
+            _LOGGER.debug("Health probe of %s:%s failed: %s", self.ip, self.port, e)
+            return False
+
+    async def async_query(self, query: str, columns: tuple[str, ...], backfill: bool = False) -> list[tuple[str, ...]]:
+        """Run a Flux query within the shared concurrency limit and the entry's timeout.
+
+        Returns the given columns of every row, parsed as the response arrives.
+        Backfill queries wait for the backfill limit instead of the poll one,
+        get ``BACKFILL_TIMEOUT`` to read their response and are left out of
+        the poll statistics.
+        """
+        timeout = self.timeout
+        if backfill:
+            timeout = aiohttp.ClientTimeout(
+                total=timeout.connect + BACKFILL_TIMEOUT.total_seconds(), connect=timeout.connect, sock_read=BACKFILL_TIMEOUT.total_seconds()
+            )
+        async with self._backfill_limit if backfill else self._poll_limit:
+            start = time.monotonic()
+            try:
+                # Cancelling the refresh cancels the request with it, the timeout bounds it otherwise.
+                async with asyncio.timeout(timeout.total):
+                    result = await self.client.query(query, columns, timeout)
+            except Exception:
+                if not backfill:
+                    self.statistics.record(time.monotonic() - start, None)
+                raise
+        if not backfill:
+            self.statistics.record(time.monotonic() - start, result.size, result.on_wire)
+        return result.rows
+
+    @callback
+    def async_push(self, points: Iterable[tuple[str, str, float | str, float | None]]) -> None:
+        """Merge pushed ``(measurement, field, value, timestamp)`` points into the data.
+
+        Only series of the catalog are taken, the others have no sensor.
+        Points without a timestamp are taken as written now. Pushed
+        timestamps advance the watermarks, so the next poll does not read
+        the same points again.
+        """
+        values = dict(self.data or {})
+        samples = []
+        now = time.time()
+        for measurement, field, value, timestamp in points:
+            key = (measurement, field)
+            if key not in self.catalog:
+                continue
+            values[key] = value
+            samples.append((key, value, now if timestamp is None else timestamp))
+            if timestamp is not None:
+                written = dt_util.utc_from_timestamp(timestamp)
+                if key not in self._watermarks or written > self._watermarks[key]:
+                    self._watermarks[key] = written
+        self._record_history(samples)
+        self.async_set_updated_data(values)
+
+    def _record_history(self, samples: Iterable[tuple[tuple[str, str], float | str, float]]) -> None:
+        for key, value, timestamp in samples:
+            history = self.history.get(key[1])
+            # Only the measurement the sensor uses, other measurements may report the same field
+            if history is not None and isinstance(value, float) and key in self.catalog:
+                history.append(timestamp, value)
+
+    def _next_interval(self, values: dict[tuple[str, str], float | str]) -> timedelta:
+        if self.push_mode:
+            return max(self.fast_interval, self.slow_interval)
+        if self.adaptive_polling:
+            production = [value for (_, field), value in values.items() if field == PRODUCTION_FIELD]
+            if production and not any(production):
+                return max(self.fast_interval, self.slow_interval)
+        return self._aligned_interval(self.fast_interval)
+
+    @property
+    def write_period(self) -> timedelta | None:
+        """Write period of the box, as far as it could be learned yet."""
+        if len(self._write_times) < 3:
+            return None
+        times = list(self._write_times)
+        # Polls may miss writes, so the shortest step between seen writes is the best estimate.
+        step = min(newer - older for older, newer in zip(times, times[1:]))
+        return timedelta(seconds=round(step.total_seconds())) or None
+
+    def _aligned_interval(self, interval: timedelta) -> timedelta:
+        """Stretch ``interval`` so the poll lands just after the next expected write."""
+        period = self.write_period
+        if period is None:
+            return interval
+        now = dt_util.utcnow()
+        last = self._write_times[-1]
+        # The clocks of the box and Home Assistant disagree, or the box stopped writing.
+        if last > now or now - last > LAST_WINDOW:
+            return interval
+        writes = math.ceil((now + interval - WRITE_MARGIN - last) / period)
+        return last + writes * period + WRITE_MARGIN - now
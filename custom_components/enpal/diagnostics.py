@@ -0,0 +1,31 @@
+"""Diagnostics support for the Enpal integration."""
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+from .coordinator import EnpalDataUpdateCoordinator
+
+TO_REDACT = {'enpal_token'}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    coordinator: EnpalDataUpdateCoordinator = hass.data[DOMAIN][entry.entry_id]['coordinator']
+    return {
+        'data': async_redact_data(dict(entry.data), TO_REDACT),
+        'options': async_redact_data(dict(entry.options), TO_REDACT),
+        'polling': {
+            'update_interval': coordinator.update_interval.total_seconds() if coordinator.update_interval else None,
+            'last_update_success': coordinator.last_update_success,
+            'write_period': coordinator.write_period.total_seconds() if coordinator.write_period else None,
+            **coordinator.statistics.as_dict(),
+        },
+        'series': len(coordinator.data or {}),
+    }
@@ -0,0 +1,127 @@
+"""Helpers for reading Flux query responses of the Enpal box."""
+from __future__ import annotations
+
+import csv
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timezone
+
+# Only a header row per table is needed, the annotation rows are just overhead.
+CSV_DIALECT = {'header': True, 'annotations': []}
+
+
+def flux_string(value: str) -> str:
+    """Quote ``value`` as a Flux string literal."""
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def build_last_query(fields: Iterable[str], start: datetime | None = None) -> str:
+    """Build the query for the latest value of each of ``fields``.
+
+    Without ``start`` the last five minutes are searched.
+    """
+    field_set = ', '.join(flux_string(field) for field in fields)
+    start_time = '-5m' if start is None else flux_time(start)
+    return f'from(bucket: "solar") \
+      |> range(start: {start_time}) \
+      |> filter(fn: (r) => contains(value: r._field, set: [{field_set}])) \
+      |> last()'
+
+
+def flux_time(value: datetime) -> str:
+    """Format an aware datetime as a Flux time literal."""
+    if value.microsecond:
+        return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def build_hourly_query(fields: Iterable[str], start: datetime, stop: datetime) -> str:
+    """Build the query for hourly mean, min and max of ``fields``.
+
+    The results are named after the aggregate and ``_time`` is the start
+    of each hour.
+    """
+    field_set = ', '.join(flux_string(field) for field in fields)
+    query = f'data = from(bucket: "solar") \
+      |> range(start: {flux_time(start)}, stop: {flux_time(stop)}) \
+      |> filter(fn: (r) => contains(value: r._field, set: [{field_set}]))\n'
+    for fn in ('mean', 'min', 'max'):
+        query += f'data |> aggregateWindow(every: 1h, fn: {fn}, timeSrc: "_start", createEmpty: false) |> yield(name: "{fn}")\n'
+    return query
+
+
+class FluxCSVParser:
+    """Incremental reader of the given columns of a Flux CSV response.
+
+    Text is fed in chunks as it arrives, and the rows of every line that
+    is complete are returned right away, so a response never has to be
+    held as a whole. A line ending inside a quoted value is kept until
+    the quote is closed.
+
+    Tables are separated by an empty line and start with their own header
+    row, from which the positions of ``columns`` are looked up. Annotation
+    rows are skipped in case the server sends them anyway.
+    """
+
+    def __init__(self, columns: tuple[str, ...]) -> None:
+        self.columns = columns
+        self._indexes: list[int] | None = None
+        # The incomplete last line of the text fed so far
+        self._pending = ''
+        # Lines of a record with an open quote and the number of quotes in them
+        self._record = ''
+        self._quotes = 0
+
+    def feed(self, text: str) -> list[tuple[str, ...]]:
+        """Add the next chunk of the response and return the rows it completes."""
+        lines = (self._pending + text).split('\n')
+        self._pending = lines.pop()
+        return self._parse(lines)
+
+    def close(self) -> list[tuple[str, ...]]:
+        """Return the rows of a last line without a line break."""
+        lines = [self._pending] if self._pending else []
+        self._pending = ''
+        rows = self._parse(lines)
+        if self._record:
+            raise ValueError('Flux response ends inside a quoted value')
+        return rows
+
+    def _parse(self, lines: list[str]) -> list[tuple[str, ...]]:
+        records = []
+        for line in lines:
+            self._quotes += line.count('"')
+            self._record += line + '\n'
+            if self._quotes % 2:
+                continue
+            records.append(self._record)
+            self._record = ''
+            self._quotes = 0
+
+        rows = []
+        for row in csv.reader(records):
+            if not row or row[0].startswith('#'):
+                self._indexes = None
+                continue
+            if self._indexes is None:
+                try:
+                    self._indexes = [row.index(column) for column in self.columns]
+                except ValueError:
+                    raise ValueError(f'Unexpected Flux response header: {",".join(row)}') from None
+                continue
+            rows.append(tuple(map(row.__getitem__, self._indexes)))
+        return rows
+
+
+def iter_columns(text: str, columns: tuple[str, ...]) -> Iterator[tuple[str, ...]]:
+    """Yield the given columns of every row of a complete Flux CSV response."""
+    parser = FluxCSVParser(columns)
+    yield from parser.feed(text)
+    yield from parser.close()
+
+
+def parse_value(value: str) -> float | str:
+    """Convert a ``_value`` cell to a number where possible."""
+    try:
+        return float(value)
+    except ValueError:
+        return value
@@ -0,0 +1,100 @@
+"""Short-window statistics over the latest samples of a field."""
+from __future__ import annotations
+
+from array import array
+from collections import deque
+
+
+class RingBuffer:
+    """Samples of the last ``window`` seconds with cheap statistics.
+
+    Samples are ``(timestamp, value)`` pairs, where the timestamp is the
+    time the point was written at. Samples older than ``window`` seconds
+    before the newest one are evicted, as are samples beyond ``size``, and
+    a sample not newer than the newest one is ignored, so a point that is
+    read again is only counted once.
+
+    Samples live in two preallocated ``array('d')`` buffers. The mean is
+    kept as a running sum and minimum and maximum as monotonic queues of
+    sample numbers, so appending and every statistic are O(1) (amortized
+    for eviction and min/max).
+    """
+
+    def __init__(self, window: float, size: int) -> None:
+        self.window = window
+        self.size = size
+        self._times = array('d', bytes(8 * size))
+        self._values = array('d', bytes(8 * size))
+        # Sample n lives at n % size; kept are the samples from _first to _count - 1.
+        self._first = 0
+        self._count = 0
+        self._sum = 0.0
+        self._min: deque[int] = deque()
+        self._max: deque[int] = deque()
+
+    def __len__(self) -> int:
+        return self._count - self._first
+
+    def _time(self, sample: int) -> float:
+        return self._times[sample % self.size]
+
+    def _value(self, sample: int) -> float:
+        return self._values[sample % self.size]
+
+    def _evict(self) -> None:
+        evicted = self._first
+        self._sum -= self._value(evicted)
+        if self._min[0] == evicted:
+            self._min.popleft()
+        if self._max[0] == evicted:
+            self._max.popleft()
+        self._first = evicted + 1
+
+    def append(self, timestamp: float, value: float) -> None:
+        if len(self) and timestamp <= self._time(self._count - 1):
+            return
+        if len(self) == self.size:
+            self._evict()
+
+        sample = self._count
+        index = sample % self.size
+        self._times[index] = timestamp
+        self._values[index] = value
+        self._sum += value
+        while self._min and self._value(self._min[-1]) >= value:
+            self._min.pop()
+        self._min.append(sample)
+        while self._max and self._value(self._max[-1]) <= value:
+            self._max.pop()
+        self._max.append(sample)
+        self._count = sample + 1
+
+        while self._time(self._first) < timestamp - self.window:
+            self._evict()
+
+    @property
+    def mean(self) -> float | None:
+        return self._sum / len(self) if len(self) else None
+
+    @property
+    def min(self) -> float | None:
+        return self._value(self._min[0]) if len(self) else None
+
+    @property
+    def max(self) -> float | None:
+        return self._value(self._max[0]) if len(self) else None
+
+    @property
+    def span(self) -> float:
+        """Seconds between the oldest and the newest sample."""
+        if len(self) < 2:
+            return 0.0
+        return self._time(self._count - 1) - self._time(self._first)
+
+    @property
+    def rate(self) -> float | None:
+        """Change per second from the oldest to the newest sample."""
+        span = self.span
+        if not span:
+            return None
+        return (self._value(self._count - 1) - self._value(self._first)) / span
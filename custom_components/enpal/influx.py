@@ -0,0 +1,136 @@
+"""Minimal client for the InfluxDB of the Enpal box.
+
+Only the two endpoints the integration needs are spoken: Flux queries
+returning CSV and the health check.
+"""
+from __future__ import annotations
+
+import codecs
+import zlib
+from typing import Any, NamedTuple
+
+import aiohttp
+
+from .const import DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+from .flux import CSV_DIALECT, FluxCSVParser
+
+# Responses are read in chunks of up to this size, each inflated, decoded and parsed as it arrives.
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def get_timeout(config: dict[str, Any]) -> aiohttp.ClientTimeout:
+    """Build the request timeout configured for an entry."""
+    connect = config.get('enpal_connect_timeout', DEFAULT_CONNECT_TIMEOUT)
+    read = config.get('enpal_read_timeout', DEFAULT_READ_TIMEOUT)
+    return aiohttp.ClientTimeout(total=connect + read, connect=connect, sock_read=read)
+
+
+class InfluxError(Exception):
+    """The InfluxDB answered a request with an error status."""
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(f'{status}: {message}')
+        self.status = status
+
+
+class QueryResult(NamedTuple):
+    """Rows of a Flux query with the decoded size of its response and its size on the wire."""
+
+    rows: list[tuple[str, ...]]
+    size: int
+    on_wire: int
+
+
+class ResponseDecoder:
+    """Inflates and decodes a response chunk by chunk, counting the bytes before and after."""
+
+    def __init__(self, gzipped: bool, charset: str) -> None:
+        self._inflater = zlib.decompressobj(wbits=31) if gzipped else None
+        self._decoder = codecs.getincrementaldecoder(charset)(errors='replace')
+        self.size = 0
+        self.on_wire = 0
+
+    def decode(self, chunk: bytes) -> str:
+        self.on_wire += len(chunk)
+        if self._inflater is not None:
+            chunk = self._inflater.decompress(chunk)
+        self.size += len(chunk)
+        return self._decoder.decode(chunk)
+
+    def flush(self) -> str:
+        rest = self._inflater.flush() if self._inflater is not None else b''
+        self.size += len(rest)
+        return self._decoder.decode(rest, final=True)
+
+
+class EnpalInfluxClient:
+    """Client for the InfluxDB of one Enpal box.
+
+    With ``decompress`` the client asks for gzipped responses and inflates
+    them itself while reading, which lets it count the bytes on the wire.
+    The session must then be created with ``auto_decompress=False``.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        ip: str,
+        port: int,
+        token: str,
+        timeout: aiohttp.ClientTimeout,
+        decompress: bool = False,
+    ):
+        self.session = session
+        self.url = f'http://{ip}:{port}'
+        self.token = token
+        self.timeout = timeout
+        self.decompress = decompress
+
+    async def query(
+        self, query: str, columns: tuple[str, ...], timeout: aiohttp.ClientTimeout | None = None
+    ) -> QueryResult:
+        """Run a Flux query and return the given columns of every row.
+
+        The response is parsed while it arrives, so neither the raw nor the
+        decoded response is ever held as a whole. ``timeout`` replaces the
+        client's timeout for this query.
+        """
+        headers = {'Authorization': f'Token {self.token}', 'Accept': 'application/csv'}
+        if self.decompress:
+            headers['Accept-Encoding'] = 'gzip'
+        async with self.session.post(
+            f'{self.url}/api/v2/query',
+            params={'org': 'enpal'},
+            headers=headers,
+            json={'query': query, 'type': 'flux', 'dialect': CSV_DIALECT},
+            timeout=timeout or self.timeout,
+        ) as response:
+            gzipped = self.decompress and response.headers.get('Content-Encoding', '').lower() == 'gzip'
+            decoder = ResponseDecoder(gzipped, response.charset or 'utf-8')
+            if response.status >= 400:
+                # Error responses are a short JSON message.
+                message = [decoder.decode(chunk) async for chunk in response.content.iter_chunked(READ_CHUNK_SIZE)]
+                raise InfluxError(response.status, ''.join(message) + decoder.flush())
+            parser = FluxCSVParser(columns)
+            rows = []
+            async for chunk in response.content.iter_chunked(READ_CHUNK_SIZE):
+                rows.extend(parser.feed(decoder.decode(chunk)))
+            rows.extend(parser.feed(decoder.flush()))
+            rows.extend(parser.close())
+            return QueryResult(rows, decoder.size, decoder.on_wire)
+
+    async def health(self) -> dict:
+        # The answer is tiny, and a session without auto_decompress could not parse it compressed.
+        headers = {'Accept-Encoding': 'identity'} if self.decompress else None
+        async with self.session.get(f'{self.url}/health', headers=headers, timeout=self.timeout) as response:
+            return await response.json()
+
+    async def close(self) -> None:
+        await self.session.close()
+
+
+async def check_for_influx(client: EnpalInfluxClient):
+    resp = await client.health()
+    if resp['status'] == 'pass':
+        return True
+    return False
@@ -0,0 +1,131 @@
+"""Push ingestion of InfluxDB line protocol for the Enpal integration."""
+from __future__ import annotations
+
+import hmac
+import logging
+from http import HTTPStatus
+
+from aiohttp import web
+from homeassistant.components.http import HomeAssistantView
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_WRITE_VIEW = f'{DOMAIN}_write_view'
+# Mirrors the path of the InfluxDB v2 write API, so writers only need a different base URL.
+WRITE_URL = '/api/enpal/{entry_id}/api/v2/write'
+# Timestamp units of the write API's precision parameter, in units per second
+PRECISIONS = {'ns': 1e9, 'us': 1e6, 'ms': 1e3, 's': 1.0}
+
+
+def _split(text: str, sep: str) -> list[str]:
+    """Split ``text`` on ``sep`` unless it is escaped or inside a quoted string."""
+    parts = []
+    start = 0
+    quoted = False
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == '\\':
+            i += 2
+            continue
+        if char == '"':
+            quoted = not quoted
+        elif char == sep and not quoted:
+            parts.append(text[start:i])
+            start = i + 1
+        i += 1
+    parts.append(text[start:])
+    return parts
+
+
+def _unescape(text: str) -> str:
+    for char in (',', '=', ' ', '"'):
+        text = text.replace('\\' + char, char)
+    return text.replace('\\\\', '\\')
+
+
+def _parse_field_value(raw: str) -> float | str:
+    if raw.startswith('"') and raw.endswith('"') and len(raw) >= 2:
+        return raw[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+    if raw in ('t', 'T', 'true', 'True', 'TRUE'):
+        return 1.0
+    if raw in ('f', 'F', 'false', 'False', 'FALSE'):
+        return 0.0
+    if raw[-1:] in ('i', 'u'):
+        raw = raw[:-1]
+    return float(raw)
+
+
+def parse_line_protocol(body: str, precision: str = 'ns') -> list[tuple[str, str, float | str, float | None]]:
+    """Parse InfluxDB line protocol into ``(measurement, field, value, timestamp)`` tuples.
+
+    Timestamps are converted from ``precision`` to seconds and are None
+    for lines without one. Tags are accepted but not returned, since the
+    integration only keys values by measurement and field.
+
+    Raises ValueError on malformed lines.
+    """
+    points = []
+    for line in body.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = _split(line, ' ')
+        if len(parts) not in (2, 3):
+            raise ValueError(f'Malformed line: {line}')
+        measurement = _unescape(_split(parts[0], ',')[0])
+        timestamp = int(parts[2]) / PRECISIONS[precision] if len(parts) == 3 else None
+        for field in _split(parts[1], ','):
+            key_parts = _split(field, '=')
+            if len(key_parts) < 2:
+                raise ValueError(f'Malformed field: {field}')
+            key = key_parts[0]
+            points.append((measurement, _unescape(key), _parse_field_value(field[len(key) + 1:]), timestamp))
+    return points
+
+
+class EnpalWriteView(HomeAssistantView):
+    """Accepts line protocol writes and feeds them into an entry's coordinator.
+
+    Writers authenticate the same way as against the Enpal box's InfluxDB,
+    with ``Authorization: Token <token>`` of the config entry.
+    """
+
+    url = WRITE_URL
+    name = 'api:enpal:write'
+    requires_auth = False
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+
+    async def post(self, request: web.Request, entry_id: str) -> web.Response:
+        entry_data = self.hass.data[DOMAIN].get(entry_id)
+        if entry_data is None or not entry_data.get('enpal_push_mode'):
+            return web.Response(status=HTTPStatus.NOT_FOUND)
+
+        expected = f'Token {entry_data["enpal_token"]}'.encode()
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), expected):
+            return web.Response(status=HTTPStatus.UNAUTHORIZED)
+
+        precision = request.query.get('precision', 'ns')
+        if precision not in PRECISIONS:
+            return self.json_message(f'Unsupported precision: {precision}', HTTPStatus.BAD_REQUEST)
+        try:
+            points = parse_line_protocol(await request.text(), precision)
+        except ValueError as e:
+            _LOGGER.debug("Rejected line protocol write: %s", e)
+            return self.json_message(str(e), HTTPStatus.BAD_REQUEST)
+
+        entry_data['coordinator'].async_push(points)
+        return web.Response(status=HTTPStatus.NO_CONTENT)
+
+
+def async_register_write_view(hass: HomeAssistant) -> None:
+    """Register the write endpoint once for all entries."""
+    if hass.data.get(DATA_WRITE_VIEW):
+        return
+    hass.http.register_view(EnpalWriteView(hass))
+    hass.data[DATA_WRITE_VIEW] = True
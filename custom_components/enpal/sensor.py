@@ -1,82 +1,48 @@
 """Platform for sensor integration."""
 from __future__ import annotations
 
-import asyncio
-import uuid
-from datetime import timedelta, datetime
-from typing import NamedTuple
+from collections.abc import Iterable
+from datetime import datetime
 from homeassistant.components.sensor import (SensorEntity)
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant import config_entries
 from homeassistant.helpers.device_registry import DeviceEntryType
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.entity_registry import async_get, async_entries_for_config_entry
-from custom_components.enpal.const import DOMAIN
-import aiohttp
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+from custom_components.enpal.const import DEADBANDS, DEFAULT_ONLY_ON_CHANGE, DOMAIN, EnpalSensorConfig, deadband_option, field_config, relative_deadband_option, unique_id
+from custom_components.enpal.coordinator import EnpalDataUpdateCoordinator, signal_catalog_updated
+from custom_components.enpal.history import RingBuffer
 import logging
-from influxdb_client import InfluxDBClient
 
 _LOGGER = logging.getLogger(__name__)
-SCAN_INTERVAL = timedelta(seconds=20)
-
-VERSION= '0.1.0'
-
-class EnpalSensorConfig(NamedTuple):
-    icon: str
-    name: str
-    device_class: str
-    unit: str
-
-FIELD_MAP: dict[str, EnpalSensorConfig] = {
-    'Power.DC.Total': EnpalSensorConfig('mdi:solar-power', 'Enpal Solar Production Power', 'power', 'W'),
-    'Power.House.Total': EnpalSensorConfig('mdi:home-lightning-bolt', 'Enpal Power House Total', 'power', 'W'),
-    'Power.External.Total': EnpalSensorConfig('mdi:home-lightning-bolt', 'Enpal Power External Total', 'power', 'W'),
-    'Energy.Consumption.Total.Day': EnpalSensorConfig('mdi:home-lightning-bolt', 'Enpal Energy Consumption', 'energy', 'kWh'),
-    
-    'Energy.External.Total.Out.Day': EnpalSensorConfig('mdi:transmission-tower-export', 'Enpal Energy External Out Day', 'energy', 'kWh'),
-    'Energy.External.Total.In.Day': EnpalSensorConfig('mdi:transmission-tower-import', 'Enpal Energy External In Day', 'energy', 'kWh'),
-    
-    'Energy.Production.Total.Day': EnpalSensorConfig('mdi:solar-power-variant', 'Enpal Production Day', 'energy', 'kWh'),
-    
-    'Voltage.Phase.A': EnpalSensorConfig('mdi:lightning-bolt', 'Enpal Voltage Phase A', 'voltage', 'V'),
-    'Current.Phase.A': EnpalSensorConfig('mdi:lightning-bolt', 'Enpal Ampere Phase A', 'current', 'A'),
-    'Power.AC.Phase.A': EnpalSensorConfig('mdi:lightning-bolt', 'Enpal Power Phase A', 'power', 'W'),
-    'Voltage.Phase.B': EnpalSensorConfig('mdi:lightning-bolt', 'Enpal Voltage Phase B', 'voltage', 'V'),
-    'Current.Phase.B': EnpalSensorConfig('mdi:lightning-bolt', 'Enpal Ampere Phase B', 'current', 'A'),
-    'Power.AC.Phase.B': EnpalSensorConfig('mdi:lightning-bolt', 'Enpal Power Phase B', 'power', 'W'),
-    'Voltage.Phase.C': EnpalSensorConfig('mdi:lightning-bolt', 'Enpal Voltage Phase C', 'voltage', 'V'),
-    'Current.Phase.C': EnpalSensorConfig('mdi:lightning-bolt', 'Enpal Ampere Phase C', 'current', 'A'),
-    'Power.AC.Phase.C': EnpalSensorConfig('mdi:lightning-bolt', 'Enpal Power Phase C', 'power', 'W'),
-    
-    'Current.String.1': EnpalSensorConfig('mdi:sun-angle', 'Enpal Current String 1', 'current', 'A'),
-    'Voltage.String.1': EnpalSensorConfig('mdi:sun-angle', 'Enpal Voltage String 1', 'voltage', 'V'),
-    'Power.DC.String.1': EnpalSensorConfig('mdi:sun-angle', 'Enpal Power String 1', 'power', 'W'),
-    'Current.String.2': EnpalSensorConfig('mdi:sun-angle', 'Enpal Current String 2', 'current', 'A'),
-    'Voltage.String.2': EnpalSensorConfig('mdi:sun-angle', 'Enpal Voltage String 2', 'voltage', 'V'),
-    'Power.DC.String.2': EnpalSensorConfig('mdi:sun-angle', 'Enpal Power String 2', 'power', 'W'),
-    
-    'Power.Battery.Charge.Discharge': EnpalSensorConfig('mdi:battery-charging', 'Enpal Battery Power', 'power', 'W'),
-    'Energy.Battery.Charge.Level': EnpalSensorConfig('mdi:battery', 'Enpal Battery Percent', 'battery', '%'),
-    'Energy.Battery.Charge.Day': EnpalSensorConfig('mdi:battery-arrow-up', 'Enpal Battery Charge Day', 'energy', 'kWh'),
-    'Energy.Battery.Discharge.Day': EnpalSensorConfig('mdi:battery-arrow-down', 'Enpal Battery Discharge Day', 'energy', 'kWh'),
-    'Energy.Battery.Charge.Total.Unit.1': EnpalSensorConfig('mdi:battery-arrow-up', 'Enpal Battery Charge Total', 'energy', 'kWh'),
-    'Energy.Battery.Discharge.Total.Unit.1': EnpalSensorConfig('mdi:battery-arrow-down', 'Enpal Battery Discharge Total', 'energy', 'kWh'),
-    
-    'State.Wallbox.Connector.1.Charge': EnpalSensorConfig('mdi:ev-station', 'Wallbox Charge Percent', 'battery', '%'),
-    'Power.Wallbox.Connector.1.Charging': EnpalSensorConfig('mdi:ev-station', 'Wallbox Charging Power', 'power', 'W'),
-    'Energy.Wallbox.Connector.1.Charged.Total': EnpalSensorConfig('mdi:ev-station', 'Wallbox Charging Total', 'energy', 'Wh'),
+
+# Rolling statistics offered for fields with a history: name suffix and whether the value keeps the field's unit.
+STATISTICS: dict[str, tuple[str, bool]] = {
+    'mean': ('Average', True),
+    'min': ('Minimum', True),
+    'max': ('Maximum', True),
+    'rate': ('Rate of Change', False),
 }
 
-def get_tables(ip: str, port: int, token: str):
-    client = InfluxDBClient(url=f'http://{ip}:{port}', token=token, org='enpal')
-    query_api = client.query_api()
 
-    query = 'from(bucket: "solar") \
-      |> range(start: -5m) \
-      |> last()'
+def get_deadband(field_config: EnpalSensorConfig, config: dict) -> tuple[float, float]:
+    """Return the (absolute, relative) deadband of a field.
+
+    A field's own override wins over the deadband configured for its device class.
+    """
+    device_class = field_config.device_class
+    deadband, relative_deadband = DEADBANDS.get(device_class, (0.0, 0.0))
+    if device_class in DEADBANDS:
+        deadband = config.get(deadband_option(device_class), deadband)
+        relative_deadband = config.get(relative_deadband_option(device_class), relative_deadband)
+    if field_config.deadband is not None:
+        deadband = field_config.deadband
+    if field_config.relative_deadband is not None:
+        relative_deadband = field_config.relative_deadband
+    return deadband, relative_deadband / 100
 
-    tables = query_api.query(query)
-    return tables
 
 async def async_setup_entry(
     hass: HomeAssistant,
@@ -85,9 +51,6 @@ async def async_setup_entry(
 ):
     # Get the config entry for the integration
     config = hass.data[DOMAIN][config_entry.entry_id]
-    if config_entry.options:
-        config.update(config_entry.options)
-    to_add = []
     if not 'enpal_host_ip' in config:
         _LOGGER.error("No enpal_host_ip in config entry")
         return
@@ -98,80 +61,154 @@ async def async_setup_entry(
         _LOGGER.error("No enpal_token in config entry")
         return
 
-    global_config = hass.data[DOMAIN]
-
-    tables = await hass.async_add_executor_job(get_tables, config['enpal_host_ip'], config['enpal_host_port'], config['enpal_token'])
-
-    encountered_fields = set()
-    for table in tables:
-        field = table.records[0].values['_field']
-        measurement = table.records[0].values['_measurement']
-        
-        if field in encountered_fields:
-            # There may be duplicates because of different _measurement values
-            # e.g. "inverter" and "powerSensor" share some fields
-            # we also can't choose which measurement's field to use, 
-            # since different Enpal devices have different measurements for the same fields
-            # Why? idk, ask Enpal
-            continue
-        encountered_fields.add(field)
-        try:
-            field_config = FIELD_MAP[field]
-        except KeyError:
-            _LOGGER.debug("Encountered field %s without config. This is normal. Skipping", field)
-            continue
-        to_add.append(EnpalSensor(field, measurement, field_config.icon, field_config.name, config['enpal_host_ip'], config['enpal_host_port'], config['enpal_token'], field_config.device_class, field_config.unit))
-        encountered_fields.add(field)
+    coordinator: EnpalDataUpdateCoordinator = config['coordinator']
+    only_on_change = config.get('enpal_only_on_change', DEFAULT_ONLY_ON_CHANGE)
+
+    def create_sensors(measurement: str, field: str) -> list[SensorEntity]:
+        sensor_config = field_config(field)
+        sensors = [EnpalSensor(coordinator, field, measurement, sensor_config.icon, sensor_config.name, sensor_config.device_class, sensor_config.unit, only_on_change, get_deadband(sensor_config, config))]
+        if field in coordinator.history:
+            sensors.extend(
+                EnpalStatisticSensor(coordinator, field, measurement, sensor_config, statistic, only_on_change, get_deadband(sensor_config, config))
+                for statistic in STATISTICS
+            )
+        return sensors
+
+    def unique_ids(measurement: str, field: str) -> list[str]:
+        ids = [unique_id(measurement, field)]
+        if field in coordinator.history:
+            ids.extend(unique_id(measurement, field, statistic) for statistic in STATISTICS)
+        return ids
+
+    known = set(coordinator.catalog)
+    to_add = [sensor for measurement, field in coordinator.catalog for sensor in create_sensors(measurement, field)]
+
+    @callback
+    def async_catalog_updated() -> None:
+        catalog = set(coordinator.catalog)
+        # The coordinator only drops fields that were missing from several discoveries in a row.
+        removed = known - catalog
+        async_remove_entities(hass, [entity_unique_id for measurement, field in removed for entity_unique_id in unique_ids(measurement, field)])
+        added = [key for key in coordinator.catalog if key not in known]
+        known.difference_update(removed)
+        known.update(added)
+        async_add_entities([sensor for measurement, field in added for sensor in create_sensors(measurement, field)])
+
+    config_entry.async_on_unload(
+        async_dispatcher_connect(hass, signal_catalog_updated(config_entry.entry_id), async_catalog_updated)
+    )
 
+    # Only drop registry entries of sensors that are gone, the others are
+    # picked up again by unique_id and keep their customisations.
+    wanted = {sensor.unique_id for sensor in to_add}
     entity_registry = async_get(hass)
     entries = async_entries_for_config_entry(
         entity_registry, config_entry.entry_id
     )
     for entry in entries:
-        entity_registry.async_remove(entry.entity_id)
+        if entry.unique_id not in wanted:
+            entity_registry.async_remove(entry.entity_id)
+
+    async_add_entities(to_add)
+
+
+def has_changed(
+    written: tuple[bool, float | str | None] | None,
+    state: tuple[bool, float | str | None],
+    deadband: tuple[float, float],
+    only_on_change: bool,
+) -> bool:
+    """Whether an ``(available, value)`` state is to be written after the ``written`` one.
 
-    async_add_entities(to_add, update_before_add=True)
+    Without only_on_change every poll is written, with it a number has to
+    move by more than the deadband.
+    """
+    if written is None or not only_on_change:
+        return True
+    available, value = written
+    new_available, new_value = state
+    if available != new_available:
+        return True
+    if value is None or new_value is None or isinstance(value, str) or isinstance(new_value, str):
+        # Text of an extra field, deadbands do not apply.
+        return value != new_value
+    threshold = max(deadband[0], abs(value) * deadband[1])
+    return abs(new_value - value) > threshold
 
 
-class EnpalSensor(SensorEntity):
+@callback
+def async_remove_entities(hass: HomeAssistant, unique_ids: Iterable[str]) -> None:
+    """Remove sensors from the entity registry, which also removes them from Home Assistant."""
+    entity_registry = async_get(hass)
+    for entity_unique_id in unique_ids:
+        entity_id = entity_registry.async_get_entity_id('sensor', DOMAIN, entity_unique_id)
+        if entity_id is not None:
+            entity_registry.async_remove(entity_id)
+
 
-    def __init__(self, field: str, measurement: str, icon:str, name: str, ip: str, port: int, token: str, device_class: str, unit: str):
+class EnpalSensor(CoordinatorEntity[EnpalDataUpdateCoordinator], SensorEntity):
+    # last_check changes on every poll and would otherwise make each state unique in the recorder
+    _unrecorded_attributes = frozenset({'last_check'})
+
+    def __init__(self, coordinator: EnpalDataUpdateCoordinator, field: str, measurement: str, icon:str, name: str, device_class: str, unit: str, only_on_change: bool = False, deadband: tuple[float, float] = (0.0, 0.0)):
+        super().__init__(coordinator)
         self.field = field
         self.measurement = measurement
-        self.ip = ip
-        self.port = port
-        self.token = token
         self.enpal_device_class = device_class
         self.unit = unit
+        self.only_on_change = only_on_change
+        self.deadband, self.relative_deadband = deadband
         self._attr_icon = icon
         self._attr_name = name
-        self._attr_unique_id = f'enpal_{measurement}_{field}'
+        self._attr_unique_id = unique_id(measurement, field)
         self._attr_extra_state_attributes = {}
+        # (available, native value) of the last state written by a coordinator update
+        self._written = None
+        if coordinator.data is not None:
+            self._update_from_coordinator(self._read_value())
 
+    @property
+    def available(self) -> bool:
+        # Setup does not wait for the first poll, so there may be no data yet.
+        return super().available and self.coordinator.data is not None
 
-    async def async_update(self) -> None:
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        value = self._read_value()
+        state = (self.available, value)
+        if not has_changed(self._written, state, (self.deadband, self.relative_deadband), self.only_on_change):
+            # The entity keeps the state it last wrote.
+            return
+        self._written = state
+        self._update_from_coordinator(value)
+        super()._handle_coordinator_update()
 
-        # Get the IP address from the API
+    def _read_value(self) -> float | str | None:
+        """The field's value in the coordinator's data, without changing the entity."""
+        data = self.coordinator.data
+        if data is None:
+            return self._attr_native_value
+        key = (self.measurement, self.field)
+        if key not in data:
+            # A field the box has gone quiet on keeps its last value, one not seen yet reads 0.
+            return 0.0 if self._attr_native_value is None else self._attr_native_value
+        value = data[key]
+        if isinstance(value, str) and self.unit is None:
+            # Extra fields may be text.
+            return value
         try:
-            client = InfluxDBClient(url=f'http://{self.ip}:{self.port}', token=self.token, org="enpal")
-            query_api = client.query_api()
-
-            query = f'from(bucket: "solar") \
-              |> range(start: -5m) \
-              |> filter(fn: (r) => r["_measurement"] == "{self.measurement}") \
-              |> filter(fn: (r) => r["_field"] == "{self.field}") \
-              |> last()'
-
-            tables = await self.hass.async_add_executor_job(query_api.query, query)
-
-            value = 0
-            if tables:
-                value = tables[0].records[0].values['_value']
+            return round(float(value), 2)
+        except Exception as e:
+            _LOGGER.error(f'{e}')
+            return None
 
-            self._attr_native_value = round(float(value), 2)
+    def _update_from_coordinator(self, value: float | str | None) -> None:
+        try:
+            self._attr_native_value = value
             self._attr_device_class = self.enpal_device_class
             self._attr_native_unit_of_measurement	= self.unit
-            self._attr_state_class = 'measurement'
+            # Text has no state class.
+            self._attr_state_class = None if isinstance(value, str) else 'measurement'
             self._attr_extra_state_attributes['last_check'] = datetime.now()
             self._attr_extra_state_attributes['field'] = self.field
             self._attr_extra_state_attributes['measurement'] = self.measurement
@@ -184,32 +221,62 @@ class EnpalSensor(SensorEntity):
                 self._attr_extra_state_attributes['last_reset'] = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
                 self._attr_state_class = 'total_increasing'
 
-            if self.field == 'Percent.Storage.Level':
-                if self._attr_native_value >= 10:
-                    self._attr_icon = "mdi:battery-outline"
-                if self._attr_native_value <= 19 and self._attr_native_value >= 10:
-                    self._attr_icon = "mdi:battery-10"
-                if self._attr_native_value <= 29 and self._attr_native_value >= 20:
-                    self._attr_icon = "mdi:battery-20"
-                if self._attr_native_value <= 39 and self._attr_native_value >= 30:
-                    self._attr_icon = "mdi:battery-30"
-                if self._attr_native_value <= 49 and self._attr_native_value >= 40:
-                    self._attr_icon = "mdi:battery-40"
-                if self._attr_native_value <= 59 and self._attr_native_value >= 50:
-                    self._attr_icon = "mdi:battery-50"
-                if self._attr_native_value <= 69 and self._attr_native_value >= 60:
-                    self._attr_icon = "mdi:battery-60"
-                if self._attr_native_value <= 79 and self._attr_native_value >= 70:
-                    self._attr_icon = "mdi:battery-70"
-                if self._attr_native_value <= 89 and self._attr_native_value >= 80:
-                    self._attr_icon = "mdi:battery-80"
-                if self._attr_native_value <= 99 and self._attr_native_value >= 90:
-                    self._attr_icon = "mdi:battery-90"
-                if self._attr_native_value == 100:
-                    self._attr_icon = "mdi:battery"
-
         except Exception as e:
             _LOGGER.error(f'{e}')
-            self._state = 'Error'
             self._attr_native_value = None
-            self._attr_extra_state_attributes['last_check'] = datetime.now()
\ No newline at end of file
+            self._attr_extra_state_attributes['last_check'] = datetime.now()
+
+
+class EnpalStatisticSensor(CoordinatorEntity[EnpalDataUpdateCoordinator], SensorEntity):
+    """Rolling statistic over the recent samples the coordinator keeps for a field."""
+
+    _attr_state_class = 'measurement'
+    _unrecorded_attributes = frozenset({'samples', 'window'})
+
+    def __init__(self, coordinator: EnpalDataUpdateCoordinator, field: str, measurement: str, field_config: EnpalSensorConfig, statistic: str, only_on_change: bool = False, deadband: tuple[float, float] = (0.0, 0.0)):
+        super().__init__(coordinator)
+        self.field = field
+        self.statistic = statistic
+        self.history: RingBuffer = coordinator.history[field]
+        suffix, keeps_unit = STATISTICS[statistic]
+        self.only_on_change = only_on_change
+        # The deadband is in the field's unit, which a rate does not have.
+        self.deadband = deadband if keeps_unit else (0.0, 0.0)
+        self._written = None
+        self._attr_icon = field_config.icon
+        self._attr_name = f'{field_config.name} {suffix}'
+        self._attr_unique_id = unique_id(measurement, field, statistic)
+        if keeps_unit:
+            self._attr_device_class = field_config.device_class
+            self._attr_native_unit_of_measurement = field_config.unit
+        else:
+            self._attr_native_unit_of_measurement = f'{field_config.unit}/s'
+        self._attr_extra_state_attributes = {'field': field, 'measurement': measurement}
+        self._update_from_history(self._read_value())
+
+    @property
+    def available(self) -> bool:
+        return super().available and len(self.history) > 0
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        value = self._read_value()
+        state = (self.available, value)
+        if not has_changed(self._written, state, self.deadband, self.only_on_change):
+            # The entity keeps the state it last wrote.
+            return
+        self._written = state
+        self._update_from_history(value)
+        super()._handle_coordinator_update()
+
+    def _read_value(self) -> float | None:
+        value = getattr(self.history, self.statistic)
+        return None if value is None else round(value, 2)
+
+    def _update_from_history(self, value: float | None) -> None:
+        self._attr_native_value = value
+        self._attr_extra_state_attributes = {
+            **self._attr_extra_state_attributes,
+            'samples': len(self.history),
+            'window': round(self.history.span),
+        }
@@ -0,0 +1 @@
+"""Tests for the Enpal integration."""
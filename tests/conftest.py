@@ -0,0 +1,95 @@
+"""Fixtures for the Enpal tests.
+
+The tests of the modules that do not depend on Home Assistant run
+anywhere. The others are only collected where
+pytest-homeassistant-custom-component is installed.
+"""
+from __future__ import annotations
+
+from collections.abc import AsyncIterator, Iterator
+from pathlib import Path
+from typing import TYPE_CHECKING
+from unittest.mock import patch
+
+import pytest
+
+if TYPE_CHECKING:
+    from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+    from custom_components.enpal.coordinator import EnpalDataUpdateCoordinator
+
+    from .fake_influx import FakeInfluxDB
+
+FIXTURES = Path(__file__).parent / 'fixtures'
+TOKEN = 'test-token'
+# Header of the recorded response, for responses built in the tests.
+HEADER = ',result,table,_start,_stop,_time,_value,_field,_measurement\r\n'
+# Tests of the modules that import nothing from Home Assistant.
+STANDALONE_TESTS = ('test_flux.py', 'test_history.py')
+
+try:
+    import pytest_homeassistant_custom_component  # noqa: F401
+except ImportError:
+    collect_ignore = [path.name for path in Path(__file__).parent.glob('test_*.py') if path.name not in STANDALONE_TESTS]
+
+
+def load_fixture(name: str) -> str:
+    # Bytes are decoded as they are, so the CRLF line ends of InfluxDB are kept.
+    return (FIXTURES / name).read_bytes().decode()
+
+
+async def setup_entry(hass, data: dict, options: dict | None = None) -> MockConfigEntry:
+    """Add an entry and set it up, including the first poll."""
+    from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+    from custom_components.enpal.const import DOMAIN
+
+    entry = MockConfigEntry(domain=DOMAIN, data=data, options=options or {})
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done(wait_background_tasks=True)
+    return entry
+
+
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations(request):
+    if 'hass' in request.fixturenames:
+        request.getfixturevalue('enable_custom_integrations')
+
+
+@pytest.fixture(autouse=True)
+def no_start_jitter(request) -> Iterator[None]:
+    """Start the first poll of an entry right away instead of after its random jitter."""
+    if 'hass' not in request.fixturenames:
+        yield
+        return
+    with patch('custom_components.enpal.coordinator.random.uniform', return_value=0.0):
+        yield
+
+
+@pytest.fixture
+async def fake_influx() -> AsyncIterator[FakeInfluxDB]:
+    from .fake_influx import FakeInfluxDB
+
+    server = FakeInfluxDB(load_fixture('last_query.csv'), TOKEN)
+    await server.start()
+    yield server
+    await server.close()
+
+
+@pytest.fixture
+def entry_data(fake_influx: FakeInfluxDB) -> dict:
+    return {'enpal_host_ip': '127.0.0.1', 'enpal_host_port': fake_influx.port, 'enpal_token': TOKEN}
+
+
+@pytest.fixture
+async def coordinator(hass, entry_data: dict) -> AsyncIterator[EnpalDataUpdateCoordinator]:
+    """A coordinator that discovered the fields of the fake InfluxDB, outside of any entry."""
+    from custom_components.enpal.coordinator import EnpalDataUpdateCoordinator, create_client, get_timeout
+
+    client = create_client(hass, entry_data['enpal_host_ip'], entry_data['enpal_host_port'], entry_data['enpal_token'], get_timeout(entry_data))
+    coordinator = EnpalDataUpdateCoordinator(hass, 'test', client, entry_data)
+    await coordinator.async_discover()
+    yield coordinator
+    await coordinator.async_shutdown()
+    await client.close()
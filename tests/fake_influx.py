@@ -0,0 +1,144 @@
+"""Local stand-in for the InfluxDB of an Enpal box."""
+from __future__ import annotations
+
+import csv
+import gzip
+import io
+import re
+from datetime import datetime
+from typing import NamedTuple
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+FIELD_SET = re.compile(r'set: \[([^\]]*)\]')
+FIELD_EQUALS = re.compile(r'r\._field == "([^"]*)"')
+ABSOLUTE_START = re.compile(r'range\(start: (\d{4}-[^,)\s]+)')
+
+
+class Block(NamedTuple):
+    """Tables of a Flux CSV response sharing their annotations and header."""
+
+    annotations: dict[str, list[str]]
+    header: list[str]
+    rows: list[list[str]]
+
+
+def parse_blocks(text: str) -> list[Block]:
+    blocks = []
+    annotations: dict[str, list[str]] = {}
+    header = None
+    for row in csv.reader(io.StringIO(text)):
+        if not row:
+            header = None
+            annotations = {}
+        elif row[0].startswith('#'):
+            annotations[row[0][1:]] = row
+        elif header is None:
+            header = row
+            blocks.append(Block(annotations, header, []))
+        else:
+            blocks[-1].rows.append(row)
+    return blocks
+
+
+def parse_time(value: str) -> datetime:
+    # InfluxDB writes nanoseconds, datetime keeps microseconds.
+    value = re.sub(r'(\.\d{6})\d*', r'\1', value.replace('Z', '+00:00'))
+    return datetime.fromisoformat(value)
+
+
+class FakeInfluxDB:
+    """Answers Flux queries from a recorded response and counts the traffic.
+
+    Like the box, only the rows of the fields a query filters for are
+    sent, and with an absolute range start only the points written since.
+    The recorded annotation rows are sent when the dialect asks for them;
+    without them the result column is filled in from the ``#default``
+    annotation. Responses are gzipped when the client asks for it.
+    """
+
+    def __init__(self, response: str, token: str) -> None:
+        self.response = response
+        self.token = token
+        self.compress = True
+        self.requests = 0
+        self.bytes_sent = 0
+        self.queries: list[str] = []
+        # Compressed once per response, so benchmarks do not time the server's gzip.
+        self._compressed: dict[str, bytes] = {}
+        self.app = web.Application()
+        self.app.router.add_post('/api/v2/query', self._query)
+        self.app.router.add_get('/health', self._health)
+        self.server = TestServer(self.app, host='127.0.0.1')
+
+    @property
+    def port(self) -> int:
+        return self.server.port
+
+    async def start(self) -> None:
+        await self.server.start_server()
+
+    async def close(self) -> None:
+        await self.server.close()
+
+    def reset_counters(self) -> None:
+        self.requests = 0
+        self.bytes_sent = 0
+        self.queries.clear()
+
+    def answer(self, query: str, annotations: list[str]) -> str:
+        """The part of the recorded response that ``query`` selects."""
+        fields = None
+        if match := FIELD_SET.search(query):
+            fields = set(re.findall(r'"([^"]*)"', match.group(1)))
+        elif match := FIELD_EQUALS.search(query):
+            fields = {match.group(1)}
+        start = None
+        if match := ABSOLUTE_START.search(query):
+            start = parse_time(match.group(1))
+
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator='\r\n')
+        for block in parse_blocks(self.response):
+            field, written = block.header.index('_field'), block.header.index('_time')
+            rows = [
+                row for row in block.rows
+                if (fields is None or row[field] in fields) and (start is None or parse_time(row[written]) >= start)
+            ]
+            if not rows:
+                continue
+            if out.tell():
+                out.write('\r\n')
+            for name, annotation in block.annotations.items():
+                if name in annotations:
+                    writer.writerow(annotation)
+            writer.writerow(block.header)
+            default = block.annotations.get('default')
+            for row in rows:
+                if default is not None and not annotations:
+                    row = [''] + [cell or default_cell for cell, default_cell in zip(row[1:], default[1:])]
+                writer.writerow(row)
+        out.write('\r\n')
+        return out.getvalue()
+
+    async def _query(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if request.headers.get('Authorization') != f'Token {self.token}':
+            return web.json_response({'code': 'unauthorized', 'message': 'unauthorized access'}, status=401)
+        body = await request.json()
+        self.queries.append(body['query'])
+        text = self.answer(body['query'], body.get('dialect', {}).get('annotations', []))
+        payload = text.encode()
+        headers = {'Content-Type': 'text/csv; charset=utf-8'}
+        if self.compress and 'gzip' in request.headers.get('Accept-Encoding', ''):
+            if text not in self._compressed:
+                self._compressed[text] = gzip.compress(payload)
+            payload = self._compressed[text]
+            headers['Content-Encoding'] = 'gzip'
+        self.bytes_sent += len(payload)
+        return web.Response(body=payload, headers=headers)
+
+    async def _health(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        return web.json_response({'name': 'influxdb', 'message': 'ready for queries and writes', 'status': 'pass'})
@@ -0,0 +1,122 @@
+"""Benchmark of setup and steady-state polling against a local fake InfluxDB.
+
+The fake InfluxDB answers from the recorded response in
+``fixtures/last_query.csv``. Wall time, HTTP requests, bytes sent by the
+server and the tracemalloc peak are reported per phase (run with ``-s`` to
+see them, they are also attached to the test report as properties).
+
+The request counts are asserted, as they are what a regression in the
+polling logic changes. The bytes are compared with one poll as the
+integration used to send it: the whole bucket of the last five minutes,
+with all annotations and uncompressed.
+"""
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import aiohttp
+
+from custom_components.enpal.const import DOMAIN
+from custom_components.enpal.coordinator import create_client, get_timeout
+
+from .conftest import TOKEN, setup_entry
+
+STEADY_STATE_POLLS = 20
+BASELINE_QUERY = 'from(bucket: "solar") |> range(start: -5m) |> last()'
+BASELINE_DIALECT = {'header': True, 'annotations': ['datatype', 'group', 'default']}
+TRANSPORT_QUERIES = 200
+
+
+@contextmanager
+def measure(name, fake_influx, record_property):
+    fake_influx.reset_counters()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = {}
+    try:
+        yield result
+    finally:
+        result['wall_time'] = time.perf_counter() - start
+        result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        result['requests'] = fake_influx.requests
+        result['bytes'] = fake_influx.bytes_sent
+        for key, value in result.items():
+            record_property(f'{name}_{key}', value)
+        print(
+            f'{name}: {result["wall_time"] * 1000:.1f} ms, {result["requests"]} requests, '
+            f'{result["bytes"]} bytes, {result["peak_memory"] / 1024:.0f} KiB peak'
+        )
+
+
+async def baseline_bytes(fake_influx) -> int:
+    """Bytes of one poll of the whole bucket, as the integration used to query it."""
+    fake_influx.reset_counters()
+    async with aiohttp.ClientSession() as session:
+        async with session.post(
+            f'http://127.0.0.1:{fake_influx.port}/api/v2/query',
+            params={'org': 'enpal'},
+            headers={'Authorization': f'Token {TOKEN}', 'Accept-Encoding': 'identity'},
+            json={'query': BASELINE_QUERY, 'type': 'flux', 'dialect': BASELINE_DIALECT},
+        ) as response:
+            await response.read()
+    return fake_influx.bytes_sent
+
+
+async def test_setup_and_polling(hass, fake_influx, entry_data, record_property):
+    baseline = await baseline_bytes(fake_influx)
+    record_property('baseline_bytes', baseline)
+    print(f'baseline: {baseline} bytes per poll')
+
+    with measure('setup', fake_influx, record_property) as setup:
+        entry = await setup_entry(hass, entry_data)
+    # Discovery and the first poll, both together smaller than one poll of the baseline.
+    assert setup['requests'] == 2
+    assert setup['bytes'] < baseline
+
+    coordinator = hass.data[DOMAIN][entry.entry_id]['coordinator']
+    with measure('steady_state', fake_influx, record_property) as steady_state:
+        for _ in range(STEADY_STATE_POLLS):
+            await coordinator.async_refresh()
+        await hass.async_block_till_done()
+    assert coordinator.last_update_success
+    assert steady_state['requests'] == STEADY_STATE_POLLS
+    record_property('bytes_per_poll', steady_state['bytes'] / STEADY_STATE_POLLS)
+    # Nothing new was written, so the polls after the watermark return no rows at all.
+    assert steady_state['bytes'] < baseline
+
+    state = hass.states.get('sensor.enpal_solar_production_power')
+    assert state is not None
+    assert float(state.state) == 1241.5
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_gzip_transport(hass, fake_influx, entry_data, record_property):
+    """Bytes on the wire and CPU time of gzipped against plain responses.
+
+    CPU time is that of the whole process, so it includes the fake server
+    sending the responses, but not compressing them. It includes parsing
+    the rows, which happens while the response is read.
+    """
+    client = create_client(hass, '127.0.0.1', fake_influx.port, entry_data['enpal_token'], get_timeout(entry_data))
+    results = {}
+    for compress in (False, True):
+        fake_influx.compress = compress
+        fake_influx.reset_counters()
+        cpu = time.process_time()
+        for _ in range(TRANSPORT_QUERIES):
+            result = await client.query(BASELINE_QUERY, ('_measurement', '_field', '_value', '_time'))
+        cpu = time.process_time() - cpu
+        name = 'gzip' if compress else 'plain'
+        results[name] = result
+        record_property(f'{name}_bytes_per_query', result.on_wire)
+        record_property(f'{name}_cpu_per_query', cpu / TRANSPORT_QUERIES)
+        print(f'{name}: {result.on_wire} bytes, {cpu / TRANSPORT_QUERIES * 1e6:.0f} us CPU per query')
+        # What the client counts on the wire is what the server sent.
+        assert fake_influx.bytes_sent == result.on_wire * TRANSPORT_QUERIES
+    await client.close()
+
+    assert results['gzip'].rows == results['plain'].rows
+    assert results['gzip'].size == results['plain'].size == results['plain'].on_wire
+    assert results['gzip'].on_wire * 3 < results['gzip'].size
@@ -0,0 +1,35 @@
+"""Tests for the config flow of the Enpal integration."""
+from homeassistant import config_entries
+from homeassistant.data_entry_flow import FlowResultType
+
+from custom_components.enpal.const import DOMAIN
+
+from .conftest import HEADER
+
+
+async def configure(hass, user_input):
+    result = await hass.config_entries.flow.async_init(DOMAIN, context={'source': config_entries.SOURCE_USER})
+    assert result['type'] == FlowResultType.FORM
+    return await hass.config_entries.flow.async_configure(result['flow_id'], user_input)
+
+
+async def test_valid_token_creates_entry(hass, fake_influx, entry_data):
+    result = await configure(hass, entry_data)
+    assert result['type'] == FlowResultType.CREATE_ENTRY
+    assert result['data'] == entry_data
+    # The token is probed with a single field, not the whole bucket.
+    assert 'r._field == "Power.DC.Total"' in fake_influx.queries[-1]
+    assert 'limit(n: 1)' in fake_influx.queries[-1]
+
+
+async def test_rejected_token(hass, fake_influx, entry_data):
+    result = await configure(hass, {**entry_data, 'enpal_token': 'wrong'})
+    assert result['type'] == FlowResultType.FORM
+    assert result['errors'] == {'base': 'token_invalid'}
+
+
+async def test_valid_token_without_recent_data(hass, fake_influx, entry_data):
+    # A box that has not written lately is still set up, the coordinator retries.
+    fake_influx.response = HEADER
+    result = await configure(hass, entry_data)
+    assert result['type'] == FlowResultType.CREATE_ENTRY
@@ -0,0 +1,161 @@
+"""Tests for the polling logic of the coordinator."""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from homeassistant.helpers.update_coordinator import UpdateFailed
+from homeassistant.util import dt as dt_util
+
+from custom_components.enpal.coordinator import (
+    CATALOG_MAX_MISSES,
+    DATA_BACKFILL_LIMIT,
+    DATA_POLL_LIMIT,
+    LAST_WINDOW,
+    MAX_BACKOFF_INTERVAL,
+    MAX_CONCURRENT_POLLS,
+)
+from custom_components.enpal.flux import build_last_query, flux_time
+
+from .conftest import HEADER, load_fixture, setup_entry
+
+FIXTURE_TIME = '2024-06-01T12:00:00Z'
+
+
+def at(written: str) -> str:
+    """The recorded response with all points written at ``written``."""
+    return load_fixture('last_query.csv').replace(FIXTURE_TIME, written)
+
+
+async def test_first_poll_searches_full_window(coordinator, fake_influx):
+    await coordinator.async_refresh()
+    assert coordinator.last_update_success
+    assert 'range(start: -5m)' in fake_influx.queries[-1]
+    assert coordinator.data[('inverter', 'Power.DC.Total')] == 1241.5
+
+
+async def test_later_polls_start_after_watermark(coordinator, fake_influx):
+    await coordinator.async_refresh()
+    await coordinator.async_refresh()
+    assert 'range(start: 2024-06-01T12:00:00.000001Z)' in fake_influx.queries[-1]
+
+
+async def test_series_without_new_points_keep_their_value(coordinator, fake_influx):
+    await coordinator.async_refresh()
+    fake_influx.response = HEADER + ',_result,0,,,2024-06-01T12:00:30Z,1300,Power.DC.Total,inverter\r\n'
+    await coordinator.async_refresh()
+    assert coordinator.data[('inverter', 'Power.DC.Total')] == 1300.0
+    assert coordinator.data[('powerSensor', 'Power.House.Total')] == 1247.0
+
+
+async def test_full_window_after_gap_drops_quiet_series(coordinator, fake_influx):
+    await coordinator.async_refresh()
+    coordinator._last_success -= LAST_WINDOW.total_seconds() + 1
+    fake_influx.response = HEADER + ',_result,0,,,2024-06-01T12:06:00Z,1300,Power.DC.Total,inverter\r\n'
+    await coordinator.async_refresh()
+    assert 'range(start: -5m)' in fake_influx.queries[-1]
+    assert ('powerSensor', 'Power.House.Total') not in coordinator.data
+    # Energy counters were not queried and are carried over.
+    assert ('inverter', 'Energy.Production.Total.Day') in coordinator.data
+
+
+async def test_polls_align_with_write_period(coordinator, fake_influx):
+    now = dt_util.utcnow().replace(microsecond=0)
+    for seconds_ago in (61, 31, 1):
+        fake_influx.response = at(flux_time(now - timedelta(seconds=seconds_ago)))
+        await coordinator.async_refresh()
+    assert coordinator.write_period == timedelta(seconds=30)
+    # The next write is due 29 s from now and the poll two seconds after it.
+    assert coordinator.update_interval.total_seconds() == pytest.approx(31, abs=1)
+
+
+async def test_no_alignment_without_write_period(coordinator):
+    await coordinator.async_refresh()
+    await coordinator.async_refresh()
+    assert coordinator.write_period is None
+    assert coordinator.update_interval == coordinator.fast_interval
+
+
+async def test_backoff_is_capped_during_long_outages(coordinator, fake_influx):
+    fake_influx.token = 'rotated'
+    coordinator._failures = 100
+    await coordinator.async_refresh()
+    assert isinstance(coordinator.last_exception, UpdateFailed)
+    assert coordinator.update_interval == MAX_BACKOFF_INTERVAL
+
+
+async def test_discovery_drops_fields_only_after_repeated_misses(coordinator, fake_influx):
+    wallbox = ('wallbox', 'Power.Wallbox.Connector.1.Charging')
+    assert wallbox in coordinator.catalog
+    fake_influx.response = load_fixture('last_query.csv').replace(',Power.Wallbox.Connector.1.Charging,', ',Unknown.Field,')
+    for _ in range(CATALOG_MAX_MISSES - 1):
+        await coordinator.async_discover()
+        assert wallbox in coordinator.catalog
+    await coordinator.async_discover()
+    assert wallbox not in coordinator.catalog
+
+
+async def test_discovery_resets_misses_when_field_returns(coordinator, fake_influx):
+    wallbox = ('wallbox', 'Power.Wallbox.Connector.1.Charging')
+    recorded = fake_influx.response
+    fake_influx.response = recorded.replace(',Power.Wallbox.Connector.1.Charging,', ',Unknown.Field,')
+    for _ in range(CATALOG_MAX_MISSES - 1):
+        await coordinator.async_discover()
+    fake_influx.response = recorded
+    await coordinator.async_discover()
+    fake_influx.response = recorded.replace(',Power.Wallbox.Connector.1.Charging,', ',Unknown.Field,')
+    await coordinator.async_discover()
+    assert wallbox in coordinator.catalog
+
+
+async def test_history_counts_each_point_once(coordinator, fake_influx):
+    await coordinator.async_refresh()
+    # A full-window poll after a gap reads the same points again.
+    coordinator._last_success -= LAST_WINDOW.total_seconds() + 1
+    await coordinator.async_refresh()
+    history = coordinator.history['Power.DC.Total']
+    assert len(history) == 1
+
+    fake_influx.response = HEADER + ',_result,0,,,2024-06-01T12:00:30Z,1300,Power.DC.Total,inverter\r\n'
+    await coordinator.async_refresh()
+    assert len(history) == 2
+    assert history.span == 30.0
+    assert history.rate == pytest.approx((1300 - 1241.5) / 30)
+
+
+async def test_pushed_points_use_their_timestamp(coordinator):
+    coordinator.async_push([('inverter', 'Power.DC.Total', 1000.0, 1717243200.0), ('inverter', 'Power.DC.Total', 1100.0, 1717243210.0)])
+    history = coordinator.history['Power.DC.Total']
+    assert len(history) == 2
+    assert history.span == 10.0
+
+
+async def test_pushed_points_advance_watermarks(coordinator, fake_influx):
+    await coordinator.async_refresh()
+    coordinator.async_push([('inverter', 'Power.DC.Total', 1300.0, 1717243230.0), ('inverter', 'Unknown.Field', 1.0, 1717243260.0)])
+    assert ('inverter', 'Unknown.Field') not in coordinator.data
+    assert coordinator._watermarks[('inverter', 'Power.DC.Total')] == datetime(2024, 6, 1, 12, 0, 30, tzinfo=timezone.utc)
+    # An older point does not move the watermark back.
+    coordinator.async_push([('inverter', 'Power.DC.Total', 1250.0, 1717243215.0)])
+    assert coordinator._watermarks[('inverter', 'Power.DC.Total')] == datetime(2024, 6, 1, 12, 0, 30, tzinfo=timezone.utc)
+
+
+async def test_backfill_queries_do_not_wait_for_polls(coordinator):
+    for _ in range(MAX_CONCURRENT_POLLS):
+        await coordinator._poll_limit.acquire()
+    try:
+        query = coordinator.async_query(build_last_query(['Power.DC.Total']), ('_value',), backfill=True)
+        assert await asyncio.wait_for(query, 5) == [('1241.5',)]
+    finally:
+        for _ in range(MAX_CONCURRENT_POLLS):
+            coordinator._poll_limit.release()
+
+
+async def test_last_unload_removes_shared_limits(hass, fake_influx, entry_data):
+    first = await setup_entry(hass, entry_data)
+    second = await setup_entry(hass, entry_data)
+    assert await hass.config_entries.async_unload(first.entry_id)
+    assert DATA_POLL_LIMIT in hass.data
+    assert await hass.config_entries.async_unload(second.entry_id)
+    assert DATA_POLL_LIMIT not in hass.data
+    assert DATA_BACKFILL_LIMIT not in hass.data
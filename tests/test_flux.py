@@ -0,0 +1,92 @@
+"""Tests for the Flux helpers."""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from custom_components.enpal.flux import FluxCSVParser, build_last_query, flux_string, flux_time, iter_columns, parse_value
+
+from .conftest import load_fixture
+
+
+def test_flux_string_escapes_quotes_and_backslashes():
+    assert flux_string('a"b\\c') == '"a\\"b\\\\c"'
+
+
+def test_flux_time_is_utc():
+    cest = timezone(timedelta(hours=2))
+    assert flux_time(datetime(2024, 6, 1, 14, 0, tzinfo=cest)) == '2024-06-01T12:00:00Z'
+
+
+def test_flux_time_keeps_microseconds():
+    value = datetime(2024, 6, 1, 12, 0, 0, 1, tzinfo=timezone.utc)
+    assert flux_time(value) == '2024-06-01T12:00:00.000001Z'
+
+
+def test_build_last_query_start():
+    assert 'range(start: -5m)' in build_last_query(['Power.DC.Total'])
+    start = datetime(2024, 6, 1, 12, 0, tzinfo=timezone.utc)
+    query = build_last_query(['Power.DC.Total'], start)
+    assert 'range(start: 2024-06-01T12:00:00Z)' in query
+    assert 'set: ["Power.DC.Total"]' in query
+
+
+def test_iter_columns_fixture():
+    rows = list(iter_columns(load_fixture('last_query.csv'), ('_measurement', '_field', '_value')))
+    assert ('inverter', 'Power.DC.Total', '1241.5') in rows
+    # The string values are a table of their own, with their own annotations.
+    assert ('inverter', 'State.Inverter', 'Normal') in rows
+    assert len(rows) == 38
+
+
+def test_iter_columns_reads_header_of_every_table():
+    text = (
+        ',result,table,_field,_value\r\n'
+        ',_result,0,a,1\r\n'
+        '\r\n'
+        '#datatype,string,long,string,double\r\n'
+        ',result,table,_value,_field\r\n'
+        ',_result,1,2,b\r\n'
+    )
+    assert list(iter_columns(text, ('_field', '_value'))) == [('a', '1'), ('b', '2')]
+
+
+def test_iter_columns_rejects_unexpected_header():
+    with pytest.raises(ValueError, match='Unexpected Flux response header'):
+        list(iter_columns(',result,table,_value\r\n,_result,0,1\r\n', ('_field',)))
+
+
+@pytest.mark.parametrize('size', [1, 7, 64, 4096])
+def test_parser_fed_in_chunks(size):
+    text = load_fixture('last_query.csv')
+    columns = ('_measurement', '_field', '_value')
+    parser = FluxCSVParser(columns)
+    rows = []
+    for start in range(0, len(text), size):
+        rows.extend(parser.feed(text[start:start + size]))
+    rows.extend(parser.close())
+    assert rows == list(iter_columns(text, columns))
+
+
+def test_parser_returns_rows_of_complete_lines():
+    parser = FluxCSVParser(('_field', '_value'))
+    assert parser.feed(',result,table,_field,_value\r\n,_result,0,a,1\r\n,_result,0,b,') == [('a', '1')]
+    assert parser.feed('2\r\n') == [('b', '2')]
+    assert parser.close() == []
+
+
+def test_parser_keeps_quoted_line_breaks():
+    parser = FluxCSVParser(('_field', '_value'))
+    assert parser.feed(',result,table,_field,_value\r\n,_result,0,a,"two\r\n') == []
+    assert parser.feed('lines, ""quoted"""\r\n') == [('a', 'two\r\nlines, "quoted"')]
+
+
+def test_parser_rejects_unterminated_quote():
+    parser = FluxCSVParser(('_value',))
+    parser.feed(',result,table,_value\r\n,_result,0,"open')
+    with pytest.raises(ValueError, match='quoted value'):
+        parser.close()
+
+
+def test_parse_value():
+    assert parse_value('1.5') == 1.5
+    assert parse_value('on') == 'on'
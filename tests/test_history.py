@@ -0,0 +1,73 @@
+"""Tests for the ring buffers behind the rolling statistics."""
+import random
+
+import pytest
+
+from custom_components.enpal.history import RingBuffer
+
+
+def test_empty():
+    buffer = RingBuffer(300, 3)
+    assert len(buffer) == 0
+    assert buffer.mean is None
+    assert buffer.min is None
+    assert buffer.max is None
+    assert buffer.rate is None
+    assert buffer.span == 0.0
+
+
+def test_statistics_over_last_samples():
+    buffer = RingBuffer(300, 3)
+    for timestamp, value in enumerate([5.0, 1.0, 3.0, 2.0]):
+        buffer.append(float(timestamp), value)
+    assert len(buffer) == 3
+    assert buffer.mean == pytest.approx(2.0)
+    assert buffer.min == 1.0
+    assert buffer.max == 3.0
+    assert buffer.span == 2.0
+    assert buffer.rate == pytest.approx(0.5)
+
+
+def test_evicts_samples_outside_window():
+    buffer = RingBuffer(60, 100)
+    buffer.append(0.0, 100.0)
+    buffer.append(30.0, 1.0)
+    buffer.append(60.0, 2.0)
+    assert len(buffer) == 3
+    buffer.append(61.0, 3.0)
+    assert len(buffer) == 3
+    assert buffer.max == 3.0
+    assert buffer.span == 31.0
+    # A long gap leaves only the newest sample.
+    buffer.append(1000.0, 4.0)
+    assert len(buffer) == 1
+    assert buffer.mean == 4.0
+    assert buffer.rate is None
+
+
+def test_ignores_samples_already_seen():
+    buffer = RingBuffer(300, 10)
+    buffer.append(10.0, 1.0)
+    buffer.append(10.0, 1.0)
+    buffer.append(5.0, 7.0)
+    assert len(buffer) == 1
+    assert buffer.max == 1.0
+
+
+def test_matches_naive_statistics():
+    rng = random.Random(0)
+    window, size = 20.0, 7
+    buffer = RingBuffer(window, size)
+    samples = []
+    timestamp = 0.0
+    for _ in range(500):
+        timestamp += rng.choice([0.5, 1.0, 3.0, 15.0])
+        value = rng.uniform(-100, 100)
+        buffer.append(timestamp, value)
+        samples = [(t, v) for t, v in samples + [(timestamp, value)] if t >= timestamp - window][-size:]
+        values = [v for _, v in samples]
+        assert len(buffer) == len(samples)
+        assert buffer.mean == pytest.approx(sum(values) / len(values))
+        assert buffer.min == min(values)
+        assert buffer.max == max(values)
+        assert buffer.span == samples[-1][0] - samples[0][0]
@@ -0,0 +1,71 @@
+"""Import-time benchmark of the integration.
+
+Each module is imported in a fresh interpreter with ``-X importtime``,
+after the Home Assistant modules that are loaded before any integration.
+What remains is the cost of the integration itself. It is reported (run
+with ``-s``, it is also attached to the test report) and has to stay
+within a budget, and modules that must only load on first use are
+asserted to stay out.
+"""
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).parent.parent
+# Loaded by Home Assistant core and the config entries machinery before any integration.
+PRELOADED = (
+    'homeassistant.core',
+    'homeassistant.config_entries',
+    'homeassistant.helpers.aiohttp_client',
+    'homeassistant.helpers.config_validation',
+)
+# Loaded by the first entry, the sensor platform, push mode and the backfill service, not by loading the integration.
+LAZY_MODULES = (
+    'custom_components.enpal.backfill',
+    'custom_components.enpal.coordinator',
+    'custom_components.enpal.sensor',
+    'custom_components.enpal.push',
+    'homeassistant.components.sensor',
+    'homeassistant.components.recorder.statistics',
+    'homeassistant.helpers.update_coordinator',
+    'sqlalchemy',
+)
+# Cumulative import time in milliseconds left to the integration itself. The
+# modules import a few kilobytes of their own code, a multiple of what that
+# takes leaves room for slow machines.
+BUDGET_MS = {
+    'custom_components.enpal': 20,
+    'custom_components.enpal.config_flow': 50,
+}
+
+
+def import_times(module: str) -> dict[str, int]:
+    """Cumulative import time in microseconds of every module ``module`` loads."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {", ".join(PRELOADED)}; import {module}'],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize('module', list(BUDGET_MS))
+def test_import_time(module, record_property):
+    # The best of a few runs, so a busy machine does not fail the budget.
+    runs = [import_times(module) for _ in range(3)]
+    times = min(runs, key=lambda times: times[module])
+    record_property('import_time_us', times[module])
+    print(f'{module}: {times[module] / 1000:.1f} ms')
+    loaded = [name for name in LAZY_MODULES if name in times]
+    assert not loaded, f'{module} eagerly imports {", ".join(loaded)}'
+    assert times[module] / 1000 < BUDGET_MS[module]
@@ -0,0 +1,100 @@
+"""Tests for push mode: the line protocol parser and the write endpoint."""
+from http import HTTPStatus
+
+import pytest
+
+from custom_components.enpal.const import DOMAIN
+from custom_components.enpal.push import WRITE_URL, parse_line_protocol
+
+from .conftest import TOKEN, setup_entry
+
+AUTH = {'Authorization': f'Token {TOKEN}'}
+
+
+def test_parse_fields_and_types():
+    points = parse_line_protocol('inverter,host=box Power.DC.Total=1200.5,Count=3i,On=t,State="ok" 1717243200000000000')
+    assert points == [
+        ('inverter', 'Power.DC.Total', 1200.5, 1717243200.0),
+        ('inverter', 'Count', 3.0, 1717243200.0),
+        ('inverter', 'On', 1.0, 1717243200.0),
+        ('inverter', 'State', 'ok', 1717243200.0),
+    ]
+
+
+def test_parse_timestamp_precision():
+    assert parse_line_protocol('inverter Power.DC.Total=1 1717243200500', 'ms') == [('inverter', 'Power.DC.Total', 1.0, 1717243200.5)]
+
+
+def test_parse_skips_blank_lines_and_comments():
+    body = '# written by the box\n\ninverter Power.DC.Total=1\n  \npowerSensor Power.House.Total=2\n'
+    assert parse_line_protocol(body) == [('inverter', 'Power.DC.Total', 1.0, None), ('powerSensor', 'Power.House.Total', 2.0, None)]
+
+
+def test_parse_escapes():
+    points = parse_line_protocol('my\\ measurement,tag=a\\,b field\\=name="a \\"quoted\\" value, with comma"')
+    assert points == [('my measurement', 'field=name', 'a "quoted" value, with comma', None)]
+
+
+@pytest.mark.parametrize('line', ['inverter', 'inverter Power.DC.Total', 'inverter Power.DC.Total=abc', 'inverter Power.DC.Total=1 soon', 'a b c d'])
+def test_parse_rejects_malformed_lines(line):
+    with pytest.raises(ValueError):
+        parse_line_protocol(line)
+
+
+@pytest.fixture
+async def push_entry(hass, fake_influx, entry_data):
+    return await setup_entry(hass, entry_data, {'enpal_push_mode': True})
+
+
+async def write(hass_client_no_auth, entry_id, body, headers=AUTH, **params):
+    client = await hass_client_no_auth()
+    return await client.post(WRITE_URL.format(entry_id=entry_id), data=body, headers=headers, params=params)
+
+
+async def test_write_merges_into_data(hass, hass_client_no_auth, push_entry):
+    coordinator = hass.data[DOMAIN][push_entry.entry_id]['coordinator']
+    response = await write(hass_client_no_auth, push_entry.entry_id, 'inverter Power.DC.Total=1300,Unknown.Field=1\npowerSensor Power.House.Total=900')
+    assert response.status == HTTPStatus.NO_CONTENT
+    await hass.async_block_till_done()
+
+    assert coordinator.data[('inverter', 'Power.DC.Total')] == 1300.0
+    assert coordinator.data[('powerSensor', 'Power.House.Total')] == 900.0
+    # Series outside the catalog have no sensor and are not taken.
+    assert ('inverter', 'Unknown.Field') not in coordinator.data
+    # Fields the write did not mention keep their polled value.
+    assert coordinator.data[('inverter', 'Voltage.String.1')] == 238.7
+    assert hass.states.get('sensor.enpal_solar_production_power').state == '1300.0'
+
+
+async def test_write_precision(hass, hass_client_no_auth, push_entry):
+    coordinator = hass.data[DOMAIN][push_entry.entry_id]['coordinator']
+    response = await write(hass_client_no_auth, push_entry.entry_id, 'inverter Power.DC.Total=1300 1717243230500', precision='ms')
+    assert response.status == HTTPStatus.NO_CONTENT
+    assert coordinator.history['Power.DC.Total'].span == 30.5
+
+    response = await write(hass_client_no_auth, push_entry.entry_id, 'inverter Power.DC.Total=1300 1717243231', precision='h')
+    assert response.status == HTTPStatus.BAD_REQUEST
+
+
+async def test_write_rejects_malformed_lines(hass, hass_client_no_auth, push_entry):
+    response = await write(hass_client_no_auth, push_entry.entry_id, 'inverter Power.DC.Total')
+    assert response.status == HTTPStatus.BAD_REQUEST
+
+
+@pytest.mark.parametrize('headers', [{}, {'Authorization': 'Token wrong'}, {'Authorization': TOKEN}])
+async def test_write_requires_the_entry_token(hass, hass_client_no_auth, push_entry, headers):
+    coordinator = hass.data[DOMAIN][push_entry.entry_id]['coordinator']
+    response = await write(hass_client_no_auth, push_entry.entry_id, 'inverter Power.DC.Total=1300', headers)
+    assert response.status == HTTPStatus.UNAUTHORIZED
+    assert coordinator.data[('inverter', 'Power.DC.Total')] == 1241.5
+
+
+async def test_write_to_unknown_entry(hass, hass_client_no_auth, push_entry):
+    response = await write(hass_client_no_auth, 'unknown', 'inverter Power.DC.Total=1300')
+    assert response.status == HTTPStatus.NOT_FOUND
+
+
+async def test_write_to_entry_without_push_mode(hass, hass_client_no_auth, push_entry, entry_data):
+    polled = await setup_entry(hass, entry_data)
+    response = await write(hass_client_no_auth, polled.entry_id, 'inverter Power.DC.Total=1300')
+    assert response.status == HTTPStatus.NOT_FOUND
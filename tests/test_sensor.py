@@ -0,0 +1,87 @@
+"""Tests for the sensors of the Enpal integration."""
+from homeassistant.helpers.entity_platform import async_get_platforms
+
+from custom_components.enpal.const import DOMAIN
+from custom_components.enpal.coordinator import LAST_WINDOW
+
+from .conftest import HEADER, setup_entry
+
+ENTITY_ID = 'sensor.enpal_solar_production_power'
+ONLY_ON_CHANGE = {'enpal_only_on_change': True}
+
+
+async def setup_coordinator(hass, entry_data, options=None):
+    entry = await setup_entry(hass, entry_data, options)
+    return hass.data[DOMAIN][entry.entry_id]['coordinator']
+
+
+def get_entity(hass, entity_id):
+    (platform,) = async_get_platforms(hass, DOMAIN)
+    return platform.entities[entity_id]
+
+
+async def poll_production(hass, coordinator, fake_influx, value, written):
+    fake_influx.response = HEADER + f',_result,0,,,{written},{value},Power.DC.Total,inverter\r\n'
+    await coordinator.async_refresh()
+    await hass.async_block_till_done()
+
+
+async def test_every_poll_is_written_by_default(hass, fake_influx, entry_data):
+    coordinator = await setup_coordinator(hass, entry_data)
+    assert hass.states.get(ENTITY_ID).state == '1241.5'
+
+    await poll_production(hass, coordinator, fake_influx, 1242, '2024-06-01T12:00:30Z')
+    assert hass.states.get(ENTITY_ID).state == '1242.0'
+
+
+async def test_changes_within_deadband_are_not_written(hass, fake_influx, entry_data):
+    coordinator = await setup_coordinator(hass, entry_data, ONLY_ON_CHANGE)
+    assert hass.states.get(ENTITY_ID).state == '1241.5'
+
+    # Below the default of 5 W or 1 %.
+    await poll_production(hass, coordinator, fake_influx, 1250, '2024-06-01T12:00:30Z')
+    assert hass.states.get(ENTITY_ID).state == '1241.5'
+    # The entity keeps the value it last wrote.
+    assert get_entity(hass, ENTITY_ID).native_value == 1241.5
+
+    await poll_production(hass, coordinator, fake_influx, 1300, '2024-06-01T12:01:00Z')
+    assert hass.states.get(ENTITY_ID).state == '1300.0'
+
+
+async def test_deadband_options(hass, fake_influx, entry_data):
+    options = {**ONLY_ON_CHANGE, 'enpal_power_deadband': 0.0, 'enpal_power_relative_deadband': 0.0}
+    coordinator = await setup_coordinator(hass, entry_data, options)
+
+    await poll_production(hass, coordinator, fake_influx, 1242, '2024-06-01T12:00:30Z')
+    assert hass.states.get(ENTITY_ID).state == '1242.0'
+
+
+async def test_field_deadband_overrides_device_class(hass, fake_influx, entry_data):
+    coordinator = await setup_coordinator(hass, entry_data, ONLY_ON_CHANGE)
+
+    # 0.8 V is above the 0.5 V of the voltage class, but within the 2 V of the string voltages.
+    fake_influx.response = HEADER + (
+        ',_result,0,,,2024-06-01T12:00:30Z,239.5,Voltage.String.1,inverter\r\n'
+        ',_result,1,,,2024-06-01T12:00:30Z,245.0,Voltage.Phase.A,powerSensor\r\n'
+    )
+    await coordinator.async_refresh()
+    await hass.async_block_till_done()
+    assert hass.states.get('sensor.enpal_voltage_string_1').state == '238.7'
+    assert hass.states.get('sensor.enpal_voltage_phase_a').state == '245.0'
+
+
+async def test_quiet_field_keeps_its_value(hass, fake_influx, entry_data):
+    coordinator = await setup_coordinator(hass, entry_data)
+    # After a gap, the full window no longer has a point of Power.DC.Total.
+    coordinator._last_success -= LAST_WINDOW.total_seconds() + 1
+    fake_influx.response = HEADER + ',_result,0,,,2024-06-01T12:06:00Z,900,Power.House.Total,powerSensor\r\n'
+    await coordinator.async_refresh()
+    await hass.async_block_till_done()
+    assert ('inverter', 'Power.DC.Total') not in coordinator.data
+    assert hass.states.get(ENTITY_ID).state == '1241.5'
+
+
+async def test_extra_fields(hass, fake_influx, entry_data):
+    await setup_coordinator(hass, entry_data, {'enpal_extra_fields': 'Frequency.Grid, State.Inverter'})
+    assert hass.states.get('sensor.enpal_frequency_grid').state == '50.02'
+    assert hass.states.get('sensor.enpal_state_inverter').state == 'Normal'